@@ -0,0 +1,93 @@
+# app/clients.py
+"""
+Process-wide clients: one pooled httpx.AsyncClient and one AsyncOpenAI that
+rides on it (plus a sync pair for the few blocking callers). Created lazily
+and closed in the FastAPI lifespan so every request reuses keep-alive
+connections instead of opening new ones.
+
+The OpenAI clients are built with ``max_retries=0``: retries, backoff and
+rate limiting are owned by ``app.services.llm_gateway``, which is the only
+module that should call them.
+"""
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_TIMEOUT_SECONDS,
+)
+
+_http: Optional[httpx.AsyncClient] = None
+_openai: Optional[AsyncOpenAI] = None
+_sync_http: Optional[httpx.Client] = None
+_sync_openai: Optional[OpenAI] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def _require_key() -> None:
+    if not OPENAI_API_KEY:
+        # Lazily fail with a clear message only when needed
+        raise RuntimeError("OPENAI_API_KEY not set. Set it or load via .env before running.")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            limits=_limits(),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0),
+            follow_redirects=True,
+        )
+    return _http
+
+
+def get_openai_client() -> AsyncOpenAI:
+    global _openai
+    if _openai is None:
+        _require_key()
+        _openai = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            http_client=get_http_client(),
+            max_retries=0,
+        )
+    return _openai
+
+
+def get_sync_openai_client() -> OpenAI:
+    global _sync_http, _sync_openai
+    if _sync_openai is None:
+        _require_key()
+        if _sync_http is None or _sync_http.is_closed:
+            _sync_http = httpx.Client(
+                limits=_limits(),
+                timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0),
+                follow_redirects=True,
+            )
+        _sync_openai = OpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            http_client=_sync_http,
+            max_retries=0,
+        )
+    return _sync_openai
+
+
+async def close_clients() -> None:
+    global _http, _openai, _sync_http, _sync_openai
+    _openai = None
+    _sync_openai = None
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    if _sync_http is not None:
+        _sync_http.close()
+        _sync_http = None
@@ -20,3 +20,113 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 # Default collection name used across models/services
 COLLECTION_NAME = os.getenv("MONGO_COLLECTION", "clinicAi")
+
+# Shared MongoClient pool (one client per worker process, owned by the app lifespan)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+
+# Startup index bootstrap / query-plan self-check
+# MONGO_QUERY_PLAN_CHECK: "off" | "log" (warn on COLLSCAN) | "strict" (refuse to start)
+MONGO_QUERY_PLAN_CHECK = os.getenv("MONGO_QUERY_PLAN_CHECK", "log").lower()
+
+# Shared async HTTP pool (audio downloads, OpenAI SDK transport)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Intake session store: "memory" (per process, LRU+TTL) or "mongo" (shared across workers)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "7200"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_FLUSH_INTERVAL_MS = int(os.getenv("SESSION_FLUSH_INTERVAL_MS", "50"))
+SESSION_FLUSH_BATCH_SIZE = int(os.getenv("SESSION_FLUSH_BATCH_SIZE", "100"))
+
+# Read-through cache for patient/visit reads (per process; the TTL bounds staleness across workers)
+REPO_CACHE_ENABLED = os.getenv("REPO_CACHE_ENABLED", "1") == "1"
+REPO_CACHE_MAX_ENTRIES = int(os.getenv("REPO_CACHE_MAX_ENTRIES", "10000"))
+REPO_CACHE_TTL_SECONDS = float(os.getenv("REPO_CACHE_TTL_SECONDS", "30"))
+# Fraction of cache hits re-read from Mongo to measure staleness (repo_cache.stale)
+REPO_CACHE_VERIFY_RATE = float(os.getenv("REPO_CACHE_VERIFY_RATE", "0.01"))
+
+# visit_repo.mutate_visit: compare-and-swap on the visit version, re-run on conflict
+VISIT_MUTATE_MAX_RETRIES = int(os.getenv("VISIT_MUTATE_MAX_RETRIES", "5"))
+VISIT_MUTATE_RETRY_BASE_MS = float(os.getenv("VISIT_MUTATE_RETRY_BASE_MS", "5"))
+
+# POST /consultation/notes:batch
+NOTES_BATCH_MAX_ITEMS = int(os.getenv("NOTES_BATCH_MAX_ITEMS", "500"))
+
+# Cursor pagination: consultation notes and visit history (default / max page size)
+NOTES_PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "50"))
+NOTES_PAGE_MAX = int(os.getenv("NOTES_PAGE_MAX", "200"))
+VISITS_PAGE_SIZE = int(os.getenv("VISITS_PAGE_SIZE", "20"))
+VISITS_PAGE_MAX = int(os.getenv("VISITS_PAGE_MAX", "100"))
+
+# Audio download for transcription (streamed to a per-request spooled temp file)
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(200 * 1024 * 1024)))
+AUDIO_SPOOL_MAX_MEMORY = int(os.getenv("AUDIO_SPOOL_MAX_MEMORY", str(1024 * 1024)))  # rolls to disk beyond this
+AUDIO_CHUNK_BYTES = int(os.getenv("AUDIO_CHUNK_BYTES", str(64 * 1024)))
+AUDIO_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("AUDIO_DOWNLOAD_TIMEOUT_SECONDS", "30"))
+
+# Long recordings are cut on MP3 frame boundaries and transcribed in parallel
+AUDIO_CHUNK_THRESHOLD_SECONDS = float(os.getenv("AUDIO_CHUNK_THRESHOLD_SECONDS", "180"))
+AUDIO_SEGMENT_SECONDS = float(os.getenv("AUDIO_SEGMENT_SECONDS", "120"))
+AUDIO_SEGMENT_OVERLAP_SECONDS = float(os.getenv("AUDIO_SEGMENT_OVERLAP_SECONDS", "4"))
+AUDIO_TRANSCRIBE_CONCURRENCY = int(os.getenv("AUDIO_TRANSCRIBE_CONCURRENCY", "6"))
+# Whisper rejects uploads above 25 MB: larger MP3s are always split, anything else is refused up front
+WHISPER_MAX_UPLOAD_BYTES = int(os.getenv("WHISPER_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+
+# Background jobs (transcription / SOAP). Workers run inside each app process.
+JOB_WORKERS_ENABLED = os.getenv("JOB_WORKERS_ENABLED", "1") == "1"
+JOB_MAX_CONCURRENCY = int(os.getenv("JOB_MAX_CONCURRENCY", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "900"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+
+# Content-addressed transcript cache (sha256 of audio bytes -> transcript)
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "1") == "1"
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "20000"))
+
+# SOAP generation: transcripts over the single-call budget go through map-reduce
+SOAP_SINGLE_CALL_MAX_TOKENS = int(os.getenv("SOAP_SINGLE_CALL_MAX_TOKENS", "6000"))
+SOAP_WINDOW_TOKENS = int(os.getenv("SOAP_WINDOW_TOKENS", "3000"))
+SOAP_WINDOW_OVERLAP_TOKENS = int(os.getenv("SOAP_WINDOW_OVERLAP_TOKENS", "200"))
+SOAP_MAP_CONCURRENCY = int(os.getenv("SOAP_MAP_CONCURRENCY", "4"))
+SOAP_MAP_MODEL = os.getenv("SOAP_MAP_MODEL", "gpt-4o-mini")
+
+# Batch (end-of-day) SOAP generation over every visit with a transcript but no note
+SOAP_BATCH_CONCURRENCY = int(os.getenv("SOAP_BATCH_CONCURRENCY", "4"))
+SOAP_BATCH_PAGE_SIZE = int(os.getenv("SOAP_BATCH_PAGE_SIZE", "50"))
+SOAP_BATCH_TIMEOUT_SECONDS = float(os.getenv("SOAP_BATCH_TIMEOUT_SECONDS", str(6 * 3600)))
+# Lease on the batch checkpoint, renewed after every page; must outlast the slowest page
+SOAP_BATCH_LEASE_SECONDS = int(os.getenv("SOAP_BATCH_LEASE_SECONDS", "900"))
+
+# Every OpenAI call goes through app/services/llm_gateway.py
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Per-model "model=RPM:TPM" pairs (0 = no limit); unlisted models use the defaults
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "gpt-4=500:30000,gpt-4o-mini=5000:2000000,whisper-1=500:0")
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+LLM_DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS", "500"))
+
+# Intake: if the LLM hasn't produced the next question within the deadline, the local engine answers
+INTAKE_LLM_DEADLINE_MS = int(os.getenv("INTAKE_LLM_DEADLINE_MS", "2500"))
+INTAKE_LLM_MAX_SKIP_TURNS = int(os.getenv("INTAKE_LLM_MAX_SKIP_TURNS", "3"))
+
+# Memoized opening intake questions, keyed on (age band, gender, Q/A prefix, prompt version)
+INTAKE_QUESTION_CACHE_ENABLED = os.getenv("INTAKE_QUESTION_CACHE_ENABLED", "1") == "1"
+INTAKE_QUESTION_CACHE_MAX_TURNS = int(os.getenv("INTAKE_QUESTION_CACHE_MAX_TURNS", "2"))
+INTAKE_QUESTION_CACHE_MAX_ENTRIES = int(os.getenv("INTAKE_QUESTION_CACHE_MAX_ENTRIES", "5000"))
+INTAKE_QUESTION_CACHE_TTL_SECONDS = int(os.getenv("INTAKE_QUESTION_CACHE_TTL_SECONDS", "86400"))
+
+# Intake prompt context: older Q/A turns are folded into a structured summary past this budget
+INTAKE_CONTEXT_MAX_TOKENS = int(os.getenv("INTAKE_CONTEXT_MAX_TOKENS", "400"))
+INTAKE_CONTEXT_KEEP_TURNS = int(os.getenv("INTAKE_CONTEXT_KEEP_TURNS", "3"))
@@ -1,28 +1,218 @@
 # app/db.py
+import logging
 import os
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
-from app.config import MONGO_URI, MONGO_DB_NAME
+import threading
+
+from pymongo import ASCENDING, MongoClient, monitoring
+from pymongo.errors import OperationFailure, ServerSelectionTimeoutError
+from app import metrics
+from app.config import (
+    MONGO_URI,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_QUERY_PLAN_CHECK,
+)
+
+logger = logging.getLogger(__name__)
 
 USE_MOCK = os.getenv("MONGO_MOCK") == "1"
 
-def get_mongo_client():
-    """
-    Returns a live, ping-tested MongoClient.
-    If MONGO_MOCK=1 is set, returns an in-memory mongomock client.
-    """
+# One client per process. pymongo clients are thread-safe and pool internally,
+# so every request shares this instead of paying a handshake each time.
+_client = None
+_client_lock = threading.Lock()
+
+
+class _PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Mirrors connection pool events into app.metrics (see GET /metrics)."""
+
+    def pool_created(self, event):
+        metrics.incr("mongo.pool.created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        metrics.incr("mongo.pool.cleared")
+
+    def pool_closed(self, event):
+        metrics.incr("mongo.pool.closed")
+
+    def connection_created(self, event):
+        metrics.incr("mongo.connections.created")
+        metrics.add_gauge("mongo.connections.open", 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        metrics.incr("mongo.connections.closed")
+        metrics.add_gauge("mongo.connections.open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        metrics.incr("mongo.checkout.failed")
+
+    def connection_checked_out(self, event):
+        metrics.incr("mongo.checkout.count")
+        metrics.add_gauge("mongo.connections.in_use", 1)
+
+    def connection_checked_in(self, event):
+        metrics.add_gauge("mongo.connections.in_use", -1)
+
+
+def _create_client():
     if USE_MOCK:
         import mongomock  # type: ignore
         return mongomock.MongoClient()
 
-    try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        client.admin.command("ping")
-        return client
-    except ServerSelectionTimeoutError as e:
-        raise RuntimeError(f"Cannot connect to MongoDB at {MONGO_URI}: {e}") from e
+    return MongoClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        event_listeners=[_PoolStatsListener()],
+    )
+
+
+def init_mongo_client():
+    """
+    Create the shared client and ping it once. Called from the FastAPI lifespan;
+    safe to call again (returns the existing client).
+    If MONGO_MOCK=1 is set, the shared client is an in-memory mongomock client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            client = _create_client()
+            if not USE_MOCK:
+                try:
+                    client.admin.command("ping")
+                except ServerSelectionTimeoutError as e:
+                    client.close()
+                    raise RuntimeError(f"Cannot connect to MongoDB at {MONGO_URI}: {e}") from e
+            _client = client
+        return _client
+
+
+def close_mongo_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_mongo_client():
+    """
+    Returns the process-wide MongoClient. Outside the app lifespan (scripts,
+    shells) it is created lazily on first use.
+    """
+    if _client is None:
+        return init_mongo_client()
+    return _client
+
 
 def get_database():
     client = get_mongo_client()
     name = MONGO_DB_NAME or "doctorai"
     return client[name]
+
+
+def get_db():
+    """FastAPI dependency: the shared database handle."""
+    return get_database()
+
+
+# ---------- Index bootstrap ----------
+
+def ensure_indexes(db) -> None:
+    """
+    Create the indexes the hot queries rely on. create_index is a no-op when
+    the index already exists, so this runs on every startup.
+    """
+    from app.models import visit as visit_repo
+    from app.services import job_queue, transcription_cache
+
+    patients = db.clinicAi
+    try:
+        patients.create_index([("patient_id", ASCENDING)], unique=True, name="patient_id_unique")
+    except OperationFailure as e:
+        # Existing duplicates block a unique build; keep serving and say why.
+        logger.error("Could not build unique index on clinicAi.patient_id: %s", e)
+        patients.create_index([("patient_id", ASCENDING)], name="patient_id")
+    patients.create_index(
+        [("patient_info.name", ASCENDING), ("patient_info.mobile", ASCENDING)],
+        name="patient_name_mobile",
+    )
+    # Embedded visits that have not been migrated to the visits collection yet
+    patients.create_index([("visits.visit_id", ASCENDING)], name="legacy_visits_visit_id")
+
+    visit_repo.ensure_indexes(db)
+    job_queue.ensure_indexes(db)
+    transcription_cache.ensure_indexes(db)
+
+
+def _hot_queries(db):
+    """(name, collection, filter, options) for the queries issued by models/patient.py & models/visit.py."""
+    return [
+        ("patient_by_id", db.clinicAi, {"patient_id": "_plan_check_"}, {}),
+        ("patient_by_name_mobile", db.clinicAi,
+         {"patient_info.name": "_plan_check_", "patient_info.mobile": "_plan_check_"}, {}),
+        ("legacy_visit_by_id", db.clinicAi,
+         {"patient_id": "_plan_check_", "visits.visit_id": "_plan_check_"}, {}),
+        ("visit_by_key", db.visits, {"patient_id": "_plan_check_", "visit_id": "_plan_check_"}, {}),
+        ("latest_visit", db.visits, {"patient_id": "_plan_check_"}, {"sort": [("created_at", -1)], "limit": 1}),
+        ("visit_history", db.visits, {"patient_id": "_plan_check_"},
+         {"sort": [("created_at", -1), ("visit_id", -1)], "limit": 21}),
+    ]
+
+
+def _plan_stages(plan: dict):
+    """Yield every stage name in an explain() winning plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def verify_query_plans(db, mode: str = MONGO_QUERY_PLAN_CHECK) -> list:
+    """
+    explain() each hot query and report the ones whose winning plan is a
+    COLLSCAN. mode "log" warns, "strict" raises RuntimeError, "off" skips.
+    Returns the names of the offending queries.
+    """
+    if mode == "off" or USE_MOCK:
+        return []
+
+    offenders = []
+    for name, col, flt, opts in _hot_queries(db):
+        cursor = col.find(flt)
+        if "sort" in opts:
+            cursor = cursor.sort(opts["sort"])
+        if "limit" in opts:
+            cursor = cursor.limit(opts["limit"])
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(plan)):
+            offenders.append(name)
+            logger.warning("Query %s on %s falls back to COLLSCAN", name, col.name)
+
+    metrics.set_gauge("mongo.query_plans.collscan", len(offenders))
+    if offenders and mode == "strict":
+        raise RuntimeError(f"Hot queries without index support: {', '.join(offenders)}")
+    return offenders
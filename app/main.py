@@ -1,13 +1,44 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+from app import metrics
+from app.clients import close_clients
+from app.config import JOB_WORKERS_ENABLED
+from app.db import init_mongo_client, close_mongo_client, get_database, ensure_indexes, verify_query_plans
+from app.models.visit import ConflictError
+from app.services.job_queue import start_job_workers, stop_job_workers
+from app.services.session_store import close_session_store
 
 # Import your routers
-from app.routers import intake, consultation, postvisit
+from app.routers import intake, consultation, jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled MongoClient per worker process for the app's lifetime
+    init_mongo_client()
+    db = get_database()
+    ensure_indexes(db)
+    verify_query_plans(db)
+    if JOB_WORKERS_ENABLED:
+        start_job_workers()
+    try:
+        yield
+    finally:
+        await stop_job_workers()
+        close_session_store()
+        await close_clients()
+        close_mongo_client()
+
 
 app = FastAPI(
     title="Clinic AI Backend",
     description="API backend for Clinic AI - patient intake, consultation, and post-visit processing.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS configuration (adjust origins as needed)
@@ -19,11 +50,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ConflictError)
+async def conflict_handler(request: Request, exc: ConflictError):
+    # The client can re-send; the visit was left as the other writer saved it
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
 # Include routers
 app.include_router(intake.router)
 app.include_router(consultation.router)
-app.include_router(postvisit.router)  # Optional: comment out if not implemented yet
+app.include_router(jobs.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Clinic AI backend is running"}
+
+@app.get("/metrics")
+def read_metrics():
+    """Per-process counters (Mongo pool stats, caches, LLM usage)."""
+    return metrics.snapshot()
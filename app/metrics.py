@@ -0,0 +1,61 @@
+# app/metrics.py
+"""
+Tiny in-process metrics registry.
+
+Counters and timing summaries are kept per worker process and exposed as
+JSON on ``GET /metrics``. Nothing here talks to the network.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, Dict[str, float]] = {}
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def add_gauge(name: str, delta: float) -> None:
+    with _lock:
+        _gauges[name] = _gauges.get(name, 0) + delta
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (e.g. a latency in ms) into a count/sum/max summary."""
+    with _lock:
+        t = _timings.get(name)
+        if t is None:
+            _timings[name] = {"count": 1, "sum": value, "max": value}
+        else:
+            t["count"] += 1
+            t["sum"] += value
+            if value > t["max"]:
+                t["max"] = value
+
+
+def get_counter(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        timings = {
+            k: {**v, "avg": (v["sum"] / v["count"]) if v["count"] else 0.0}
+            for k, v in _timings.items()
+        }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
@@ -0,0 +1,86 @@
+# app/migrations/split_visits.py
+"""
+Online, resumable migration of embedded ``clinicAi.visits`` arrays into the
+``visits`` collection.
+
+Patients are walked in ``_id`` order in batches; after each batch the last
+``_id`` and running counters are checkpointed in ``migrations`` so an
+interrupted run resumes where it stopped. Each visit is moved with
+``visit_repo.merge_legacy_visit``, which is idempotent and merges with visit
+documents the running app may have written in the meantime.
+
+    python -m app.migrations.split_visits [--batch-size 100]
+"""
+import argparse
+from datetime import datetime
+from typing import Any, Dict
+
+from app.db import get_database
+from app.models import visit as visit_repo
+
+MIGRATION_ID = "split_visits"
+
+
+def _load_checkpoint(db) -> Dict[str, Any]:
+    return db.migrations.find_one({"_id": MIGRATION_ID}) or {
+        "_id": MIGRATION_ID,
+        "last_id": None,
+        "patients_done": 0,
+        "visits_moved": 0,
+        "started_at": datetime.utcnow(),
+    }
+
+
+def _save_checkpoint(db, state: Dict[str, Any]) -> None:
+    state["updated_at"] = datetime.utcnow()
+    db.migrations.replace_one({"_id": MIGRATION_ID}, state, upsert=True)
+
+
+def run(db=None, batch_size: int = 100, restart: bool = False) -> Dict[str, Any]:
+    db = db if db is not None else get_database()
+    visit_repo.ensure_indexes(db)
+
+    state = _load_checkpoint(db)
+    if restart:
+        state.update(last_id=None, patients_done=0, visits_moved=0, started_at=datetime.utcnow())
+    state.pop("finished_at", None)
+
+    while True:
+        query: Dict[str, Any] = {"visits.0": {"$exists": True}}
+        if state["last_id"] is not None:
+            query["_id"] = {"$gt": state["last_id"]}
+        batch = list(
+            db.clinicAi.find(query, {"patient_id": 1, "visits": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        for patient in batch:
+            for legacy in patient.get("visits") or []:
+                if legacy.get("visit_id"):
+                    visit_repo.merge_legacy_visit(db, patient["patient_id"], legacy)
+                    state["visits_moved"] += 1
+            state["patients_done"] += 1
+            state["last_id"] = patient["_id"]
+
+        _save_checkpoint(db, state)
+        print(f" split_visits: {state['patients_done']} patients, {state['visits_moved']} visits moved")
+
+    state["finished_at"] = datetime.utcnow()
+    _save_checkpoint(db, state)
+    return state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move embedded visits into the visits collection.")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+    state = run(batch_size=args.batch_size, restart=args.restart)
+    print(f" split_visits done: {state['patients_done']} patients, {state['visits_moved']} visits moved")
+
+
+if __name__ == "__main__":
+    main()
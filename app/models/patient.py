@@ -1,49 +1,55 @@
-def get_latest_visit_snapshot(db, patient_id: str):
+from typing import Iterable, Optional
+
+from app.models import repo_cache
+from app.models import visit as visit_repo
+
+
+def get_latest_visit_snapshot(db, patient_id: str, fields: Optional[Iterable[str]] = None, cached: bool = True):
     """
-    Returns the last visit object (from visits array) for a patient.
-    Used to fetch transcript, SOAP summary, etc.
+    Returns the latest visit for a patient (from the visits collection).
+    Used to fetch transcript, SOAP summary, etc.; pass ``fields`` to fetch only those
+    and ``cached=False`` to bypass the per-process read cache.
     """
-    patient = db.clinicAi.find_one(
-        {"patient_id": patient_id},
-        {"_id": 0, "visits": {"$slice": -1}}
-    )
-    if patient and "visits" in patient and patient["visits"]:
-        return patient["visits"][0]
-    return None
+    return visit_repo.get_latest_visit(db, patient_id, fields, cached=cached)
+
+
+def get_patient_info(db, patient_id: str) -> Optional[dict]:
+    """``patient_info`` of one patient (read-through cached), or None if unknown."""
+    def load():
+        doc = db.clinicAi.find_one({"patient_id": patient_id}, {"_id": 0, "patient_info": 1})
+        return doc.get("patient_info") if doc else None
+    return repo_cache.read(db, patient_id, ("patient_info",), load)
 
 
 def get_patient_by_name_mobile(db, name: str, mobile: str):
+    # Legacy documents may still embed visits; never pull them for a dedupe check
     return db.clinicAi.find_one({
         "patient_info.name": name,
         "patient_info.mobile": mobile
-    })
+    }, {"visits": 0})
 
 def insert_patient_record(db, patient_record: dict):
     db.clinicAi.insert_one(patient_record)
+    repo_cache.invalidate(db, patient_record["patient_id"])
 
 #trancript related function
 def store_transcript(db, patient_id: str, transcript_text: str):
     from datetime import datetime
     today = datetime.today().strftime("%Y-%m-%d")
     visit_id = "V" + today.replace("-", "")
-    db.clinicAi.update_one(
-        {"patient_id": patient_id, "visits.visit_id": visit_id},
-        {"$set": {"visits.$.transcript": transcript_text}}
-    )
+    visit_repo.set_visit_fields(db, patient_id, visit_id, {"transcript": transcript_text})
 
 #audio related function
-def store_soap_summary(db, patient_id: str, soap: dict):
+def store_soap_summary(db, patient_id: str, soap: dict, meta: Optional[dict] = None):
+    """``meta`` (digest/model/prompt version/usage) lets a later request reuse the note."""
     from datetime import datetime
     today = datetime.today().strftime("%Y-%m-%d")
     visit_id = "V" + today.replace("-", "")
-    db.clinicAi.update_one(
-        {"patient_id": patient_id, "visits.visit_id": visit_id},
-        {"$set": {"visits.$.soap_summary": soap}}
-    )
+    visit_repo.set_visit_fields(db, patient_id, visit_id, {"soap_summary": soap, "soap_meta": meta})
 
 #function to get latest visit snapshot
 def get_note_state(db, patient_id: str):
-    visit = get_latest_visit_snapshot(db, patient_id)
+    visit = get_latest_visit_snapshot(db, patient_id, ("transcript", "soap_summary")) or {}
     return {
         "transcript": visit.get("transcript", ""),
         "soap_summary": visit.get("soap_summary", {})
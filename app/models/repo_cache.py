@@ -0,0 +1,101 @@
+# app/models/repo_cache.py
+"""
+Read-through cache in front of the patient/visit repository.
+
+Reads are served from a per-process LRU+TTL cache. Entries are keyed by the
+patient's current generation, and every repository write calls
+``invalidate(db, patient_id)`` afterwards, which moves the patient to a fresh
+generation: all of that patient's cached reads (any visit, any ``fields``
+selection) miss at once and the old entries simply age out of the LRU. A
+read that raced with a write stores its result under the old generation, so
+it is never served.
+
+The cache is per worker process. A write made by another worker is only seen
+here once the entry expires, so ``REPO_CACHE_TTL_SECONDS`` is the staleness
+bound across workers.
+
+Metrics (``repo_cache.*``): hits, misses and the ``hit_rate`` gauge; ``age_ms``
+of the entries served; ``invalidations``; and ``stale`` / ``verified`` for
+the sampled hits (``REPO_CACHE_VERIFY_RATE``) that are re-read from Mongo and
+compared with the cached value.
+"""
+import copy
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from app import metrics
+from app.config import (
+    REPO_CACHE_ENABLED,
+    REPO_CACHE_MAX_ENTRIES,
+    REPO_CACHE_TTL_SECONDS,
+    REPO_CACHE_VERIFY_RATE,
+)
+from app.services.utils.ttl_cache import TTLCache
+
+_cache = TTLCache(REPO_CACHE_MAX_ENTRIES, REPO_CACHE_TTL_SECONDS, name="repo_cache")
+# (db, patient_id) -> generation. Never reused, so a forgotten generation only causes misses.
+_generations = TTLCache(REPO_CACHE_MAX_ENTRIES, REPO_CACHE_TTL_SECONDS)
+_counter = itertools.count(1)
+_lock = threading.Lock()
+
+
+def _generation(db, patient_id: str) -> int:
+    key = (db.name, patient_id)
+    with _lock:
+        gen = _generations.get(key)
+        if gen is None:
+            gen = next(_counter)
+            _generations.set(key, gen)
+    return gen
+
+
+def invalidate(db, patient_id: str) -> None:
+    """Drop every cached read for ``patient_id``; call after each write."""
+    if not REPO_CACHE_ENABLED:
+        return
+    with _lock:
+        _generations.set((db.name, patient_id), next(_counter))
+    metrics.incr("repo_cache.invalidations")
+
+
+def fields_key(fields) -> Optional[Tuple[str, ...]]:
+    return tuple(fields) if fields else None
+
+
+def read(db, patient_id: str, key: Tuple[Hashable, ...], load: Callable[[], Any]) -> Any:
+    """
+    Cached ``load()``, keyed by ``key`` within ``patient_id``. None results
+    are not cached. Callers get their own copy of the value.
+    """
+    if not REPO_CACHE_ENABLED:
+        return load()
+    full_key = (db.name, patient_id, _generation(db, patient_id), *key)
+    entry = _cache.get(full_key)
+    if entry is not None:
+        stored_at, value = entry
+        metrics.observe("repo_cache.age_ms", (time.monotonic() - stored_at) * 1000)
+        if REPO_CACHE_VERIFY_RATE and random.random() < REPO_CACHE_VERIFY_RATE:
+            metrics.incr("repo_cache.verified")
+            fresh = load()
+            if fresh != value:
+                metrics.incr("repo_cache.stale")
+                value = fresh
+                if fresh is None:
+                    _cache.pop(full_key)
+                else:
+                    _cache.set(full_key, (time.monotonic(), copy.deepcopy(fresh)))
+                return value
+        return copy.deepcopy(value)
+
+    value = load()
+    if value is not None:
+        _cache.set(full_key, (time.monotonic(), copy.deepcopy(value)))
+    return value
+
+
+def clear() -> None:
+    _cache.clear()
+    _generations.clear()
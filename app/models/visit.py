@@ -0,0 +1,543 @@
+# app/models/visit.py
+"""
+Visit repository.
+
+Visits live in their own ``visits`` collection, one document per
+``(patient_id, visit_id)``, instead of an unbounded array embedded in the
+``clinicAi`` patient document. All visit reads and writes go through here.
+
+Patients created before the split may still carry an embedded ``visits``
+array until ``app.migrations.split_visits`` has moved them; reads fall back to
+the embedded copy and the first write to such a visit adopts it, so the
+migration can run while the app is serving traffic.
+
+Reads take an optional ``fields`` list (top-level or dotted visit fields) so
+callers fetch only what they use, e.g. a visit's ``consultation`` block
+without its transcript and SOAP note. ``patient_id`` and ``visit_id`` are
+always returned. Long lists are paged: a visit's consultation notes with a
+``$slice`` projection (``get_consultation_page``) and a patient's visit
+history with a keyset query on the ``patient_history`` index
+(``list_visits``).
+
+Every write that can change a visit increments its ``version`` field.
+``mutate_visit`` uses it for optimistic concurrency: the write-back only
+applies if the version is unchanged since the read, otherwise the mutation
+is re-run on a fresh copy (bounded; ``ConflictError`` once exhausted).
+
+``get_visit`` / ``get_latest_visit`` are served through ``repo_cache``; every
+write here invalidates the patient's cached reads once it has landed. The
+cache is per process, so reads that feed a write (read-then-summarize, etc.)
+pass ``cached=False`` to see writes made by other workers.
+"""
+import copy
+import random
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app import metrics
+from app.config import VISIT_MUTATE_MAX_RETRIES, VISIT_MUTATE_RETRY_BASE_MS
+from app.models import repo_cache
+
+
+class ConflictError(Exception):
+    """A visit kept changing underneath ``mutate_visit``; mapped to HTTP 409."""
+
+
+def _visits(db):
+    return db.visits
+
+
+def _patients(db):
+    return db.clinicAi
+
+
+def _key(patient_id: str, visit_id: str) -> Dict[str, str]:
+    return {"patient_id": patient_id, "visit_id": visit_id}
+
+
+def ensure_indexes(db) -> None:
+    _visits(db).create_index(
+        [("patient_id", ASCENDING), ("visit_id", ASCENDING)],
+        unique=True, name="patient_visit",
+    )
+    _visits(db).create_index(
+        [("patient_id", ASCENDING), ("created_at", DESCENDING), ("visit_id", DESCENDING)],
+        name="patient_history",
+    )
+    # Superseded by patient_history (same prefix, plus the visit_id tiebreak for paging)
+    if "patient_latest" in _visits(db).index_information():
+        _visits(db).drop_index("patient_latest")
+
+
+def _versioned(update: Dict[str, Any]) -> Dict[str, Any]:
+    """Bump ``version`` on any update that can change the document (a bare $setOnInsert can't)."""
+    if set(update) <= {"$setOnInsert"}:
+        return update
+    return {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+
+
+def _projection(fields: Optional[Iterable[str]]) -> Dict[str, int]:
+    if not fields:
+        return {"_id": 0}
+    return {"_id": 0, "patient_id": 1, "visit_id": 1, **{f: 1 for f in fields}}
+
+
+# ---------- Legacy (embedded) visits ----------
+
+def _legacy_pick(db, match: Dict[str, Any], element: Any, fields: Iterable[str]) -> Optional[Dict[str, Any]]:
+    """
+    One embedded visit, trimmed to ``fields``, cut out server-side: a $elemMatch
+    projection can only return the whole array element, so this uses $filter /
+    $arrayElemAt and projects the subfields in the aggregation.
+    """
+    pipeline = [
+        {"$match": match},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "patient_id": 1, "visit": element}},
+        {"$project": {"patient_id": 1, "visit.visit_id": 1, **{f"visit.{f}": 1 for f in fields}}},
+    ]
+    doc = next(_patients(db).aggregate(pipeline), None)
+    if not doc or not doc.get("visit"):
+        return None
+    return {"patient_id": doc["patient_id"], **doc["visit"]}
+
+
+def _legacy_visit(db, patient_id: str, visit_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    match = {"patient_id": patient_id, "visits.visit_id": visit_id}
+    if fields:
+        element = {"$arrayElemAt": [
+            {"$filter": {"input": "$visits", "as": "v", "cond": {"$eq": ["$$v.visit_id", visit_id]}}}, 0,
+        ]}
+        return _legacy_pick(db, match, element, fields)
+    doc = _patients(db).find_one(match, {"_id": 0, "visits": {"$elemMatch": {"visit_id": visit_id}}})
+    if not doc or not doc.get("visits"):
+        return None
+    return {"patient_id": patient_id, **doc["visits"][0]}
+
+
+def _legacy_latest_visit(db, patient_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    match = {"patient_id": patient_id, "visits.0": {"$exists": True}}
+    if fields:
+        return _legacy_pick(db, match, {"$arrayElemAt": ["$visits", -1]}, fields)
+    doc = _patients(db).find_one(match, {"_id": 0, "visits": {"$slice": -1}})
+    if not doc or not doc.get("visits"):
+        return None
+    return {"patient_id": patient_id, **doc["visits"][0]}
+
+
+def merge_legacy_visit(db, patient_id: str, legacy: Dict[str, Any]) -> bool:
+    """
+    Move one embedded visit into the ``visits`` collection and pull it from the
+    patient document. If the visit document already exists (written after the
+    split), only fields it lacks are filled in and legacy notes are prepended.
+    Idempotent, so an interrupted migration can simply be re-run.
+    Returns True if a new visit document was inserted.
+    """
+    visit_id = legacy["visit_id"]
+    doc = {k: v for k, v in legacy.items() if k not in ("_id", "patient_id", "visit_id")}
+    res = _visits(db).update_one(_key(patient_id, visit_id), {"$setOnInsert": doc}, upsert=True)
+    inserted = res.upserted_id is not None
+    if not inserted:
+        current = _visits(db).find_one(_key(patient_id, visit_id), {"_id": 0}) or {}
+        sets: Dict[str, Any] = {}
+        for k, v in legacy.items():
+            if k in ("_id", "patient_id", "consultation"):
+                continue
+            if k not in current:
+                sets[k] = v
+        legacy_c = legacy.get("consultation") or {}
+        current_c = current.get("consultation") or {}
+        for k, v in legacy_c.items():
+            if k != "notes" and k not in current_c:
+                sets[f"consultation.{k}"] = v
+        update: Dict[str, Any] = {}
+        if sets:
+            update["$set"] = sets
+        if "created_at" in legacy and "created_at" in current:
+            # the legacy visit is older than the document written after the split
+            update["$min"] = {"created_at": legacy["created_at"]}
+        known = {(n.get("text"), n.get("created_at")) for n in current_c.get("notes") or []}
+        missing = [n for n in legacy_c.get("notes") or [] if (n.get("text"), n.get("created_at")) not in known]
+        if missing:
+            update["$push"] = {"consultation.notes": {"$each": missing, "$position": 0}}
+        if update:
+            _visits(db).update_one(_key(patient_id, visit_id), _versioned(update))
+
+    _patients(db).update_one(
+        {"patient_id": patient_id},
+        {"$pull": {"visits": {"visit_id": visit_id}}},
+    )
+    repo_cache.invalidate(db, patient_id)
+    return inserted
+
+
+# ---------- Reads ----------
+
+def _load_visit(db, patient_id: str, visit_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    visit = _visits(db).find_one(_key(patient_id, visit_id), _projection(fields))
+    if visit is None:
+        visit = _legacy_visit(db, patient_id, visit_id, fields)
+    return visit
+
+
+def _load_latest_visit(db, patient_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    visit = _visits(db).find_one(
+        {"patient_id": patient_id}, _projection(fields),
+        sort=[("created_at", DESCENDING)],
+    )
+    if visit is None:
+        visit = _legacy_latest_visit(db, patient_id, fields)
+    return visit
+
+
+def get_visit(
+    db, patient_id: str, visit_id: str, fields: Optional[Iterable[str]] = None, cached: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """``cached=False`` reads Mongo directly, for reads whose result feeds a write."""
+    if not cached:
+        return _load_visit(db, patient_id, visit_id, fields)
+    return repo_cache.read(
+        db, patient_id, ("visit", visit_id, repo_cache.fields_key(fields)),
+        lambda: _load_visit(db, patient_id, visit_id, fields),
+    )
+
+
+def get_latest_visit(
+    db, patient_id: str, fields: Optional[Iterable[str]] = None, cached: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """Most recently created visit (transcript, SOAP summary, etc.); ``cached`` as for get_visit."""
+    if not cached:
+        return _load_latest_visit(db, patient_id, fields)
+    return repo_cache.read(
+        db, patient_id, ("latest_visit", repo_cache.fields_key(fields)),
+        lambda: _load_latest_visit(db, patient_id, fields),
+    )
+
+
+def note_key(note: Dict[str, Any]) -> datetime:
+    return note.get("created_at") or datetime.min
+
+
+def next_notes_cursor(page: List[Dict[str, Any]], after: Optional[Tuple[datetime, int]]) -> Tuple[datetime, int]:
+    """Cursor after the last note of ``page``: its ``created_at`` and how many notes at that instant were seen."""
+    last = note_key(page[-1])
+    seen = sum(1 for n in page if note_key(n) == last)
+    if after is not None and after[0] == last:
+        seen += after[1]
+    return last, seen
+
+
+def _load_consultation_page(db, patient_id: str, visit_id: str, after, limit: int, fields: Tuple[str, ...]):
+    projection: Dict[str, Any] = {"_id": 0, "patient_id": 1, "visit_id": 1}
+    for f in fields:
+        projection[f"consultation.{f}"] = 1
+    if "notes" in fields and after is not None:
+        since, skip = after
+        newer = {"$filter": {
+            "input": {"$ifNull": ["$consultation.notes", []]},
+            "as": "n",
+            "cond": {"$gte": [{"$ifNull": ["$$n.created_at", datetime.min]}, since]},
+        }}
+        projection["consultation.notes"] = {"$slice": [newer, skip, limit + 1]}
+        visit = next(_visits(db).aggregate([{"$match": _key(patient_id, visit_id)}, {"$project": projection}]), None)
+    else:
+        if "notes" in fields:
+            projection["consultation.notes"] = {"$slice": [0, limit + 1]}
+        visit = _visits(db).find_one(_key(patient_id, visit_id), projection)
+    if visit is not None:
+        return visit
+    visit = _legacy_visit(db, patient_id, visit_id, [f"consultation.{f}" for f in fields])
+    notes = ((visit or {}).get("consultation") or {}).get("notes")
+    if notes is not None:
+        if after is not None:
+            notes = [n for n in notes if note_key(n) >= after[0]][after[1]:]
+        visit["consultation"]["notes"] = notes[:limit + 1]
+    return visit
+
+
+def get_consultation_page(
+    db,
+    patient_id: str,
+    visit_id: str,
+    after: Optional[Tuple[datetime, int]],
+    limit: int,
+    fields: Iterable[str],
+) -> Optional[Dict[str, Any]]:
+    """
+    A visit with only the ``consultation`` subfields in ``fields``; ``notes``
+    is cut server-side to ``limit + 1`` notes (the extra one tells the caller
+    there is a next page). ``after`` is ``(created_at, seen)`` from
+    ``next_notes_cursor``: the page starts at notes created at or after that
+    instant, skipping the ``seen`` ones at exactly that instant (a batch of
+    notes shares one timestamp). Keyed on timestamps rather than array
+    positions, so the cursor survives legacy notes being merged in at the
+    front of the array.
+    """
+    fields = tuple(fields)
+    return repo_cache.read(
+        db, patient_id, ("consultation_page", visit_id, after, limit, fields),
+        lambda: _load_consultation_page(db, patient_id, visit_id, after, limit, fields),
+    )
+
+
+_HISTORY_SORT = [("created_at", DESCENDING), ("visit_id", DESCENDING)]
+
+
+def _history_key(visit: Dict[str, Any]) -> Tuple[datetime, str]:
+    return visit.get("created_at") or datetime.min, visit["visit_id"]
+
+
+def _legacy_history(db, patient_id: str, fields: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    """Embedded visits of a patient not yet migrated that have no visits-collection copy."""
+    if fields:
+        projection = {"_id": 0, "visits.visit_id": 1, "visits.created_at": 1, **{f"visits.{f}": 1 for f in fields}}
+    else:
+        projection = {"_id": 0, "visits": 1}
+    doc = _patients(db).find_one({"patient_id": patient_id, "visits.0": {"$exists": True}}, projection)
+    legacy = [v for v in (doc or {}).get("visits") or [] if v.get("visit_id")]
+    if not legacy:
+        return []
+    adopted = set(_visits(db).distinct(
+        "visit_id", {"patient_id": patient_id, "visit_id": {"$in": [v["visit_id"] for v in legacy]}},
+    ))
+    return [{"patient_id": patient_id, **v} for v in legacy if v["visit_id"] not in adopted]
+
+
+def _load_history(db, patient_id: str, limit: int, after, fields) -> List[Dict[str, Any]]:
+    query: Dict[str, Any] = {"patient_id": patient_id}
+    if after is not None:
+        created_at, visit_id = after
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "visit_id": {"$lt": visit_id}},
+        ]
+    projection = _projection(fields)
+    if fields:
+        projection["created_at"] = 1
+    visits = list(_visits(db).find(query, projection).sort(_HISTORY_SORT).limit(limit + 1))
+    legacy = _legacy_history(db, patient_id, fields)
+    if legacy:
+        if after is not None:
+            legacy = [v for v in legacy if _history_key(v) < tuple(after)]
+        visits = sorted(visits + legacy, key=_history_key, reverse=True)[:limit + 1]
+    return visits
+
+
+def list_visits(
+    db,
+    patient_id: str,
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+    fields: Optional[Iterable[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    A patient's visits, newest first, as keyset pages: up to ``limit + 1``
+    visits strictly older than the ``after`` ``(created_at, visit_id)`` key
+    (the extra one tells the caller there is a next page). ``created_at`` is
+    always returned so the caller can build the next key.
+    """
+    fields = repo_cache.fields_key(fields)
+    return repo_cache.read(
+        db, patient_id, ("history", limit, after, fields),
+        lambda: _load_history(db, patient_id, limit, after, fields),
+    )
+
+
+def patient_exists(db, patient_id: str) -> bool:
+    return _patients(db).find_one({"patient_id": patient_id}, {"_id": 1}) is not None
+
+
+# ---------- Writes ----------
+
+def _ensure_patient(db, patient_id: str) -> None:
+    _patients(db).update_one(
+        {"patient_id": patient_id},
+        {"$setOnInsert": {"patient_info": {}, "created_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def update_visit(db, patient_id: str, visit_id: str, update: dict, upsert: bool = True) -> bool:
+    """
+    Apply ``update`` to one visit document. With ``upsert`` the visit (and a
+    placeholder patient) is created if missing; an embedded legacy copy of the
+    visit is adopted at that point. Without ``upsert`` an un-migrated embedded
+    visit is adopted first. Returns True if a visit was matched or created.
+    """
+    try:
+        return _update_visit(db, patient_id, visit_id, update, upsert)
+    finally:
+        repo_cache.invalidate(db, patient_id)
+
+
+def _update_visit(db, patient_id: str, visit_id: str, update: dict, upsert: bool) -> bool:
+    key = _key(patient_id, visit_id)
+    update = _versioned(update)
+    if upsert:
+        update = {**update}
+        update["$setOnInsert"] = {"created_at": datetime.utcnow(), **update.get("$setOnInsert", {})}
+        res = _visits(db).update_one(key, update, upsert=True)
+        if res.upserted_id is not None:
+            legacy = _legacy_visit(db, patient_id, visit_id)
+            if legacy:
+                merge_legacy_visit(db, patient_id, legacy)
+            else:
+                _ensure_patient(db, patient_id)
+        return True
+
+    res = _visits(db).update_one(key, update)
+    if res.matched_count:
+        return True
+    legacy = _legacy_visit(db, patient_id, visit_id)
+    if not legacy:
+        return False
+    merge_legacy_visit(db, patient_id, legacy)
+    return _visits(db).update_one(key, update).matched_count > 0
+
+
+def ensure_visit(db, patient_id: str, visit_id: str) -> None:
+    update_visit(db, patient_id, visit_id, {"$setOnInsert": {}})
+
+
+def set_visit_fields(db, patient_id: str, visit_id: str, fields: Dict[str, Any], upsert: bool = False) -> bool:
+    return update_visit(db, patient_id, visit_id, {"$set": fields}, upsert=upsert)
+
+
+def mutate_visit(
+    db,
+    patient_id: str,
+    visit_id: str,
+    mutate_fn: Callable[[dict], dict],
+    max_retries: int = VISIT_MUTATE_MAX_RETRIES,
+) -> Dict[str, Any]:
+    """
+    Generic read-modify-write of a single visit: apply ``mutate_fn`` to a copy
+    of the visit and write back its top-level fields. Creates the visit if
+    missing. Returns the new visit.
+
+    The write is a compare-and-swap on ``version``. If another writer got in
+    first, the visit is re-read and ``mutate_fn`` applied again (so it must be
+    safe to call more than once), up to ``max_retries`` times with jittered
+    backoff; then ConflictError is raised.
+    """
+    ensure_visit(db, patient_id, visit_id)
+    key = _key(patient_id, visit_id)
+    try:
+        for attempt in range(max_retries + 1):
+            visit = _visits(db).find_one(key, {"_id": 0})
+            version = visit.get("version")
+            new_v = mutate_fn(copy.deepcopy(visit))  # copy before modify
+            fields = {k: v for k, v in new_v.items() if k not in ("patient_id", "visit_id", "version")}
+            update: Dict[str, Any] = {"$inc": {"version": 1}}
+            if fields:
+                update["$set"] = fields
+            # {"version": None} also matches visits written before versioning
+            res = _visits(db).update_one({**key, "version": version}, update)
+            if res.matched_count:
+                metrics.incr("visit_mutate.committed")
+                if attempt:
+                    metrics.incr("visit_mutate.retried")
+                new_v["version"] = (version or 0) + 1
+                return new_v
+            metrics.incr("visit_mutate.conflicts")
+            if attempt < max_retries:
+                time.sleep(random.uniform(0, VISIT_MUTATE_RETRY_BASE_MS * (2 ** attempt)) / 1000)
+    finally:
+        repo_cache.invalidate(db, patient_id)
+    metrics.incr("visit_mutate.failed")
+    raise ConflictError(f"Visit {patient_id}/{visit_id} changed concurrently; gave up after {max_retries + 1} attempts")
+
+
+def start_consultation(db, patient_id: str, visit_id: str) -> None:
+    update_visit(db, patient_id, visit_id, {
+        "$set": {"consultation.status": "in-progress"},
+        # keeps an earlier started_at, stamps it on first start
+        "$min": {"consultation.started_at": datetime.utcnow()},
+        # $each [] creates the notes array if missing and keeps existing notes
+        "$push": {"consultation.notes": {"$each": []}},
+    })
+
+
+def add_note(db, patient_id: str, visit_id: str, text: str) -> None:
+    update_visit(db, patient_id, visit_id, {
+        "$push": {"consultation.notes": {"text": text, "created_at": datetime.utcnow()}},
+        "$set": {"consultation.status": "in-progress"},
+    })
+
+
+def add_notes(db, items: Iterable[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Append many notes, possibly across several visits, in one unordered
+    ``bulk_write``: one ``$push: {$each: [...]}`` per visit, keeping each
+    visit's notes in request order. ``items`` are ``{patient_id, visit_id,
+    text}``; returns one ``{index, patient_id, visit_id, status[, error]}``
+    per item, in order. Visits are created (and legacy copies adopted) as
+    with ``add_note``.
+    """
+    items = list(items)
+    now = datetime.utcnow()
+    by_visit: Dict[tuple, List[int]] = {}
+    for i, item in enumerate(items):
+        by_visit.setdefault((item["patient_id"], item["visit_id"]), []).append(i)
+    groups = list(by_visit.items())
+    ops = [
+        UpdateOne(_key(pid, vid), _versioned({
+            "$push": {"consultation.notes": {"$each": [{"text": items[i]["text"], "created_at": now} for i in idx]}},
+            "$set": {"consultation.status": "in-progress"},
+            "$setOnInsert": {"created_at": now},
+        }), upsert=True)
+        for (pid, vid), idx in groups
+    ]
+
+    errors: Dict[int, str] = {}
+    upserted: Dict[int, Any] = {}
+    try:
+        if ops:
+            upserted = _visits(db).bulk_write(ops, ordered=False).upserted_ids or {}
+    except BulkWriteError as e:
+        errors = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+        upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+    try:
+        for op_index in upserted:
+            pid, vid = groups[op_index][0]
+            legacy = _legacy_visit(db, pid, vid)
+            if legacy:
+                merge_legacy_visit(db, pid, legacy)
+            else:
+                _ensure_patient(db, pid)
+    finally:
+        for pid in {pid for (pid, _), _ in groups}:
+            repo_cache.invalidate(db, pid)
+
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    for op_index, ((pid, vid), idx) in enumerate(groups):
+        for i in idx:
+            result = {"index": i, "patient_id": pid, "visit_id": vid, "status": "added"}
+            if op_index in errors:
+                result.update(status="failed", error=errors[op_index])
+            results[i] = result
+    return results
+
+
+def soap_summary_update(visit_oid: Any, soap: dict, meta: Optional[dict]) -> UpdateOne:
+    """
+    Bulk op storing a generated SOAP note on one visit (by ``_id``). Only
+    applies while the visit still has no note, so a note generated
+    interactively meanwhile is kept; bumps ``version`` like every visit write.
+    Callers invalidate the patient's cached reads after the bulk write.
+    """
+    return UpdateOne(
+        {"_id": visit_oid, "soap_summary": None},
+        _versioned({"$set": {"soap_summary": soap, "soap_meta": meta, "updated_at": datetime.utcnow()}}),
+    )
+
+
+def complete_consultation(db, patient_id: str, visit_id: str, summary: Optional[str] = None) -> None:
+    fields = {"consultation.status": "completed", "consultation.completed_at": datetime.utcnow()}
+    if summary:
+        fields["consultation.summary"] = summary
+    update_visit(db, patient_id, visit_id, {"$set": fields})
@@ -1,13 +1,26 @@
 # app/routers/consultation.py
+import json
+import re
 from datetime import datetime
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Tuple
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.db import get_database
+from app.config import (
+    NOTES_BATCH_MAX_ITEMS,
+    NOTES_PAGE_SIZE,
+    NOTES_PAGE_MAX,
+    VISITS_PAGE_SIZE,
+    VISITS_PAGE_MAX,
+)
+from app.db import get_db
 from app.models.patient import get_note_state
+from app.models import visit as visit_repo
 from app.services import audio_orchestrator, soap_orchestrator
+from app.services.utils.cursor import encode_cursor, decode_cursor
 
 router = APIRouter(prefix="/consultation", tags=["Consultation"])
 
@@ -19,21 +32,37 @@ class AudioRequest(BaseModel):
 
 class SOAPRequest(BaseModel):
     patient_id: str
+    force: bool = False  # regenerate even if the stored note matches the transcript
 
 @router.post("/transcribe")
-def transcribe_audio(req: AudioRequest):
-    return audio_orchestrator.transcribe_audio_from_url(req.patient_id, req.audio_url)
+async def transcribe_audio(req: AudioRequest):
+    return await audio_orchestrator.transcribe_audio_from_url(req.patient_id, req.audio_url)
 
 @router.post("/soap")
-def generate_soap(req: SOAPRequest):
-    return soap_orchestrator.generate_soap_summary(req.patient_id)
+async def generate_soap(req: SOAPRequest):
+    return await soap_orchestrator.generate_soap_summary(req.patient_id, force=req.force)
+
+@router.get("/soap/stream")
+async def stream_soap(patient_id: str, force: bool = False):
+    """
+    Server-Sent Events: one ``section`` event per SOAP section as soon as the
+    model finishes it, then ``done`` with the stored note (or ``error``).
+    """
+    async def _events():
+        async for event, data in soap_orchestrator.stream_soap_summary(patient_id, force=force):
+            yield f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/state")
-def note_state(patient_id: str):
-    db = get_database()
+def note_state(patient_id: str, db=Depends(get_db)):
     return get_note_state(db, patient_id)
 
-# ---------- Consultation flow (mongomock-friendly) ----------
+# ---------- Consultation flow (per-visit atomic writes via app.models.visit) ----------
 
 class ConsultationStart(BaseModel):
     patient_id: str
@@ -44,6 +73,10 @@ class NoteCreate(BaseModel):
     visit_id: str
     text: str = Field(..., min_length=1)
 
+class NotesBatch(BaseModel):
+    # Applied in order per visit; may span several visits
+    notes: List[NoteCreate] = Field(..., min_length=1, max_length=NOTES_BATCH_MAX_ITEMS)
+
 class ConsultationComplete(BaseModel):
     patient_id: str
     visit_id: str
@@ -52,131 +85,131 @@ class ConsultationComplete(BaseModel):
 class ConsultationResponse(BaseModel):
     message: str
 
-def _col(db):
-    # Use your main collection here (change if needed)
-    return db.clinicAi
-
-def _get_patient(db, patient_id: str) -> Optional[Dict[str, Any]]:
-    return _col(db).find_one({"patient_id": patient_id}, {"_id": 0})
-
-def _ensure_patient(db, patient_id: str) -> Dict[str, Any]:
-    doc = _get_patient(db, patient_id)
-    if not doc:
-        _col(db).insert_one({
-            "patient_id": patient_id,
-            "patient_info": {},
-            "visits": [],
-            "created_at": datetime.utcnow(),
-        })
-        doc = _get_patient(db, patient_id)
-    return doc
-
-def _find_visit(visits: List[Dict[str, Any]], visit_id: str) -> Optional[Dict[str, Any]]:
-    return next((v for v in visits if v.get("visit_id") == visit_id), None)
-
-def _ensure_visit(db, patient_id: str, visit_id: str) -> Dict[str, Any]:
+def _visit_not_found(db, patient_id: str) -> HTTPException:
+    if not visit_repo.patient_exists(db, patient_id):
+        return HTTPException(status_code=404, detail="Patient not found")
+    return HTTPException(status_code=404, detail="Visit not found")
+
+_CONSULTATION_FIELDS = ("status", "started_at", "completed_at", "summary", "notes")
+# Visit history without ?fields=: enough to render a list, no transcripts or notes
+_HISTORY_FIELDS = ("consultation.status", "consultation.started_at", "consultation.completed_at")
+_FIELD_PATH = re.compile(r"^[A-Za-z][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$")
+
+def _parse_fields(fields: Optional[str], allowed: Optional[Tuple[str, ...]] = None) -> Tuple[str, ...]:
+    """Comma-separated ``?fields=``; 400 on unknown or overlapping paths."""
+    parsed = tuple(dict.fromkeys(f.strip() for f in (fields or "").split(",") if f.strip()))
+    for f in parsed:
+        if not _FIELD_PATH.match(f) or (allowed is not None and f not in allowed):
+            raise HTTPException(status_code=400, detail=f"Unknown field: {f}")
+        if any(other.startswith(f + ".") for other in parsed):
+            raise HTTPException(status_code=400, detail=f"Field {f} overlaps a more specific field")
+    return parsed
+
+def _decode_after(after: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not after:
+        return None
+    try:
+        return decode_cursor(after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid 'after' cursor")
+
+@router.get("/visits")
+def list_visits(
+    patient_id: str,
+    limit: int = Query(VISITS_PAGE_SIZE, ge=1, le=VISITS_PAGE_MAX),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    db=Depends(get_db),
+):
     """
-    Ensure a visit exists by loading the patient, appending if missing,
-    and writing back the *entire* visits array (no positional operators).
-    Returns the refreshed patient document.
+    A patient's visits, newest first. Pass ``next_after`` back as ``after``
+    for the next page; ``fields`` picks visit fields (dotted paths allowed).
     """
-    patient = _ensure_patient(db, patient_id)
-    visits = list(patient.get("visits", []))
-    visit = _find_visit(visits, visit_id)
-    if not visit:
-        visit = {"visit_id": visit_id, "created_at": datetime.utcnow()}
-        visits.append(visit)
-        _col(db).update_one({"patient_id": patient_id}, {"$set": {"visits": visits}})
-        patient = _get_patient(db, patient_id)  # refresh
-    return patient
-
-def _get_visit_or_404(db, patient_id: str, visit_id: str) -> Dict[str, Any]:
-    patient = _get_patient(db, patient_id)
-    if not patient:
+    cursor = _decode_after(after)
+    try:
+        key = None if cursor is None else (
+            datetime.fromisoformat(cursor["c"]) if cursor["c"] else datetime.min, str(cursor["v"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid 'after' cursor")
+    selected = _parse_fields(fields) or _HISTORY_FIELDS
+    visits = visit_repo.list_visits(db, patient_id, limit, key, selected)
+    if not visits and cursor is None and not visit_repo.patient_exists(db, patient_id):
         raise HTTPException(status_code=404, detail="Patient not found")
-    visit = _find_visit(patient.get("visits", []), visit_id)
-    if not visit:
-        raise HTTPException(status_code=404, detail="Visit not found")
-    return {"patient": patient, "visit": visit}
-
-def _mutate_visit(db, patient_id: str, visit_id: str, mutate_fn):
-    """
-    Load patient, mutate the matching visit in Python, then write back the whole visits array.
-    This avoids positional projection/update (mongomock-safe).
-    """
-    patient = _ensure_patient(db, patient_id)
-    visits = list(patient.get("visits", []))
-    for i, v in enumerate(visits):
-        if v.get("visit_id") == visit_id:
-            visits[i] = mutate_fn(dict(v))  # copy before modify
-            break
-    else:
-        # Create visit if missing
-        visits.append(mutate_fn({"visit_id": visit_id, "created_at": datetime.utcnow()}))
-    _col(db).update_one({"patient_id": patient_id}, {"$set": {"visits": visits}})
+    next_after = None
+    if len(visits) > limit:
+        visits = visits[:limit]
+        last = visits[-1]
+        created_at = last.get("created_at")
+        next_after = encode_cursor({"c": created_at.isoformat() if created_at else None, "v": last["visit_id"]})
+    return {"patient_id": patient_id, "visits": visits, "next_after": next_after}
 
 @router.post("/start", response_model=ConsultationResponse)
-def start_consultation(payload: ConsultationStart):
-    db = get_database()
-    _ensure_visit(db, payload.patient_id, payload.visit_id)
-
-    def _set_started(v):
-        c = dict(v.get("consultation") or {})
-        c.setdefault("notes", [])
-        c["status"] = "in-progress"
-        c["started_at"] = c.get("started_at") or datetime.utcnow()
-        v["consultation"] = c
-        return v
-
-    _mutate_visit(db, payload.patient_id, payload.visit_id, _set_started)
+def start_consultation(payload: ConsultationStart, db=Depends(get_db)):
+    visit_repo.start_consultation(db, payload.patient_id, payload.visit_id)
     return ConsultationResponse(message="Consultation started")
 
 @router.post("/note", response_model=ConsultationResponse)
-def add_note(payload: NoteCreate):
-    db = get_database()
-
-    def _add(v):
-        c = dict(v.get("consultation") or {})
-        notes = list(c.get("notes") or [])
-        notes.append({"text": payload.text, "created_at": datetime.utcnow()})
-        c["notes"] = notes
-        c["status"] = "in-progress"
-        v["consultation"] = c
-        return v
-
-    _mutate_visit(db, payload.patient_id, payload.visit_id, _add)
+def add_note(payload: NoteCreate, db=Depends(get_db)):
+    visit_repo.add_note(db, payload.patient_id, payload.visit_id, payload.text)
     return ConsultationResponse(message="Note added")
 
+@router.post("/notes:batch")
+def add_notes_batch(payload: NotesBatch, db=Depends(get_db)):
+    """
+    Add a burst of notes in one round-trip. Returns one result per note, in
+    request order; a visit whose write failed marks all of its notes failed.
+    """
+    results = visit_repo.add_notes(db, [n.model_dump() for n in payload.notes])
+    added = sum(r["status"] == "added" for r in results)
+    return {"added": added, "failed": len(results) - added, "results": results}
+
 @router.get("/{patient_id}/{visit_id}")
-def get_consultation(patient_id: str, visit_id: str):
-    db = get_database()
-    data = _get_visit_or_404(db, patient_id, visit_id)
-    visit = data["visit"]
+def get_consultation(
+    patient_id: str,
+    visit_id: str,
+    limit: int = Query(NOTES_PAGE_SIZE, ge=1, le=NOTES_PAGE_MAX),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    db=Depends(get_db),
+):
+    """
+    The visit's consultation block with one page of ``notes`` (oldest first).
+    Pass ``next_after`` back as ``after`` for the next page; ``fields`` picks
+    consultation fields (status, started_at, completed_at, summary, notes).
+    """
+    cursor = _decode_after(after)
+    try:
+        key = None if cursor is None else (datetime.fromisoformat(cursor["c"]), int(cursor["k"]))
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid 'after' cursor")
+    if key is not None and key[1] < 0:
+        raise HTTPException(status_code=400, detail="Invalid 'after' cursor")
+    selected = _parse_fields(fields, _CONSULTATION_FIELDS) or _CONSULTATION_FIELDS
+    visit = visit_repo.get_consultation_page(db, patient_id, visit_id, key, limit, selected)
+    if not visit:
+        raise _visit_not_found(db, patient_id)
     c = visit.get("consultation") or {}
+    notes = c.get("notes", [])
+    next_after = None
+    if len(notes) > limit:
+        since, seen = visit_repo.next_notes_cursor(notes[:limit], key)
+        next_after = encode_cursor({"c": since.isoformat(), "k": seen})
+    consultation = {
+        "status": c.get("status", "not-started"),
+        "started_at": c.get("started_at"),
+        "completed_at": c.get("completed_at"),
+        "summary": c.get("summary"),
+        "notes": notes[:limit],
+    }
     return {
         "patient_id": patient_id,
         "visit_id": visit_id,
-        "consultation": {
-            "status": c.get("status", "not-started"),
-            "started_at": c.get("started_at"),
-            "completed_at": c.get("completed_at"),
-            "summary": c.get("summary"),
-            "notes": c.get("notes", []),
-        },
+        "consultation": {k: consultation[k] for k in selected},
+        "next_after": next_after,
     }
 
 @router.post("/complete", response_model=ConsultationResponse)
-def complete_consultation(payload: ConsultationComplete):
-    db = get_database()
-
-    def _complete(v):
-        c = dict(v.get("consultation") or {})
-        c["status"] = "completed"
-        c["completed_at"] = datetime.utcnow()
-        if payload.summary:
-            c["summary"] = payload.summary
-        v["consultation"] = c
-        return v
-
-    _mutate_visit(db, payload.patient_id, payload.visit_id, _complete)
+def complete_consultation(payload: ConsultationComplete, db=Depends(get_db)):
+    visit_repo.complete_consultation(db, payload.patient_id, payload.visit_id, payload.summary)
     return ConsultationResponse(message="Consultation completed")
@@ -1,8 +1,14 @@
-from fastapi import APIRouter
+import json
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.schemas.intake_schema import PatientInfo
-from app.services.intake_orchestrator import create_patient_record, start_intake_session, get_next_intake_question, submit_intake_answer, get_intake_state
+from app.services.intake_orchestrator import create_patient_record, start_intake_session, get_next_intake_question, submit_intake_answer, get_intake_state, IntakeChannel
 from app.schemas.intake_schema import AnswerSubmission
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/intake", tags=["Intake"])
 
 @router.post("/patient-info")
@@ -17,21 +23,87 @@ def submit_patient_info(info: PatientInfo):
 
 
 @router.post("/start")
-def start_session(patient_id: str):
-    """Start intake Q&A session for a given patient ID"""
-    return start_intake_session(patient_id)
+async def start_session(patient_id: str):
+    """Start intake Q&A session for a given patient ID (the first question is prepared in the background)"""
+    return await start_intake_session(patient_id)
 
 @router.get("/next-question")
-def next_question(patient_id: str):
-    """Get next AI-generated question for intake form"""
-    return get_next_intake_question(patient_id)
+async def next_question(session_id: str):
+    """Get next AI-generated question for intake form (instant when it was prepared in the background)"""
+    return await get_next_intake_question(session_id)
 
 @router.post("/submit-answer")
-def submit_answer(data: AnswerSubmission):
-    """Submit patient's answer to a specific question"""
-    return submit_intake_answer(data)
+async def submit_answer(session_id: str, data: AnswerSubmission, wait: bool = True):
+    """
+    Submit patient's answer to the current question. With wait=false the
+    response returns immediately while the next question is generated; fetch
+    it from GET /intake/next-question.
+    """
+    return await submit_intake_answer(session_id, data.model_dump(), wait=wait)
 
 @router.get("/state")
-def fetch_state(patient_id: str):
+def fetch_state(session_id: str):
     """Fetch current state of intake form (asked/answered questions)"""
-    return get_intake_state(patient_id)
+    return get_intake_state(session_id)
+
+
+@router.websocket("/ws")
+async def intake_ws(websocket: WebSocket, session_id: Optional[str] = None, patient_id: Optional[str] = None):
+    """
+    Whole intake over one connection. Connect with ?session_id= to resume or
+    ?patient_id= to start a session.
+
+    Server -> client: {"type": "session", "session_id"}, then per turn any
+    number of {"type": "question_delta", "text"} (question text as it is
+    generated) followed by {"type": "question", "question": {id, text, index,
+    total}} (authoritative) or {"type": "completed"}. Also {"type": "state",
+    "state"} and {"type": "error", "error"}.
+    Client -> server: {"type": "answer", "value"} or {"type": "state"}.
+    A malformed message gets an error reply and the connection stays open;
+    on an internal failure an error is sent before the socket is closed.
+    """
+    await websocket.accept()
+    channel = await IntakeChannel.open(session_id=session_id, patient_id=patient_id)
+    if channel is None:
+        await websocket.send_json({"type": "error", "error": "invalid_session"})
+        await websocket.close(code=4404)
+        return
+
+    async def on_delta(text: str) -> None:
+        await websocket.send_json({"type": "question_delta", "text": text})
+
+    async def send_question(q: Optional[dict]) -> None:
+        await websocket.send_json({"type": "question", "question": q} if q else {"type": "completed"})
+
+    try:
+        await websocket.send_json({"type": "session", "session_id": channel.session_id})
+        current = channel.pending_question()
+        await send_question(current if current else await channel.next_question(on_delta))
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+            except (KeyError, ValueError):  # binary frame / not JSON
+                await websocket.send_json({"type": "error", "error": "expected a JSON text message"})
+                continue
+            if not isinstance(msg, dict):
+                await websocket.send_json({"type": "error", "error": "message must be a JSON object"})
+                continue
+            kind = msg.get("type")
+            if kind == "answer":
+                channel.answer(msg.get("value"))
+                await send_question(await channel.next_question(on_delta))
+            elif kind == "state":
+                await websocket.send_json({"type": "state", "state": channel.state()})
+            else:
+                await websocket.send_json({"type": "error", "error": f"unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception("Intake WebSocket for session %s failed", channel.session_id)
+        try:
+            await websocket.send_json({"type": "error", "error": "internal_error"})
+            await websocket.close(code=1011)
+        except Exception:
+            pass  # the client is already gone
+    finally:
+        await channel.close()
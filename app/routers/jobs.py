@@ -0,0 +1,49 @@
+# app/routers/jobs.py
+from uuid import uuid4
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from app.routers.consultation import AudioRequest, SOAPRequest
+from app.services import job_queue
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+
+
+@router.post("/transcribe", response_model=JobAccepted, status_code=202)
+def submit_transcription(req: AudioRequest):
+    """Queue download + Whisper transcription; poll GET /jobs/{job_id}."""
+    job_id = job_queue.submit("transcribe", {"patient_id": req.patient_id, "audio_url": req.audio_url})
+    return JobAccepted(job_id=job_id, status="queued")
+
+
+@router.post("/soap", response_model=JobAccepted, status_code=202)
+def submit_soap(req: SOAPRequest):
+    """Queue SOAP generation for the patient's latest visit; poll GET /jobs/{job_id}."""
+    job_id = job_queue.submit("soap", {"patient_id": req.patient_id, "force": req.force})
+    return JobAccepted(job_id=job_id, status="queued")
+
+
+class SOAPBatchRequest(BaseModel):
+    restart: bool = False
+
+
+@router.post("/soap-batch", response_model=JobAccepted, status_code=202)
+def submit_soap_batch(req: SOAPBatchRequest):
+    """Queue SOAP generation for every visit with a transcript but no note; resumes an interrupted run."""
+    # run_id lets retries of this job resume its own checkpoint even with restart
+    job_id = job_queue.submit("soap_batch", {"restart": req.restart, "run_id": uuid4().hex})
+    return JobAccepted(job_id=job_id, status="queued")
+
+
+@router.get("/{job_id}")
+def job_status(job_id: str):
+    job = job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
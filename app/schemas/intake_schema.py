@@ -63,5 +63,7 @@ class SessionState(BaseModel):
     extras_used: int
     questions: List[str]
     answers: Dict[str, Optional[str]]
-    llm_disabled: bool
+    sources: List[str] = []        # per question: "llm" or "engine" (deadline missed / LLM failing)
+    llm_failures: int = 0          # consecutive LLM errors/timeouts; LLM is retried on later turns
+    llm_turns: List[Dict[str, float]] = []  # per LLM call: turn, prompt_tokens, cached_tokens, llm_ms
     created_at: datetime
@@ -1,62 +1,189 @@
 # Audio orchestrator logic here
+import asyncio
+import hashlib
+import logging
 import os
-import sys
-import requests
+import tempfile
+import time
+from typing import BinaryIO, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from openai import APIStatusError
+from starlette.concurrency import run_in_threadpool
+
+from app.clients import get_http_client
+from app.config import (
+    AUDIO_MAX_BYTES,
+    AUDIO_SPOOL_MAX_MEMORY,
+    AUDIO_CHUNK_BYTES,
+    AUDIO_DOWNLOAD_TIMEOUT_SECONDS,
+    AUDIO_CHUNK_THRESHOLD_SECONDS,
+    AUDIO_SEGMENT_SECONDS,
+    AUDIO_SEGMENT_OVERLAP_SECONDS,
+    AUDIO_TRANSCRIBE_CONCURRENCY,
+    WHISPER_MAX_UPLOAD_BYTES,
+)
 from app.models.patient import store_transcript
 from app.db import get_database
-db = get_database()
-# Ensure the parent directory is in sys.path so 'app' can be imported
-# sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app.config import OPENAI_API_KEY
+from app.services import llm_gateway, transcription_cache
+from app.services.utils.mp3_chunker import iter_frames, plan_segments, read_segment, stitch_transcripts
+
+logger = logging.getLogger(__name__)
+
+
+class _DownloadError(Exception):
+    pass
+
+
+class _AudioTooLarge(Exception):
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"{size} bytes (limit {limit})")
+        self.limit = limit
+
+
+def _audio_filename(audio_url: str) -> str:
+    # Whisper infers the container from the extension
+    ext = os.path.splitext(urlparse(audio_url).path)[1].lower()
+    return f"audio{ext or '.mp3'}"
+
+
+def _max_bytes(filename: str) -> int:
+    """Only MP3 can be split below Whisper's upload limit; other formats must fit in one upload."""
+    return AUDIO_MAX_BYTES if filename.endswith(".mp3") else min(AUDIO_MAX_BYTES, WHISPER_MAX_UPLOAD_BYTES)
+
+
+async def _download_to_spool(audio_url: str, max_bytes: int = AUDIO_MAX_BYTES) -> Tuple[BinaryIO, int, str]:
+    """
+    Stream the download in chunks into a per-request SpooledTemporaryFile
+    (in memory up to AUDIO_SPOOL_MAX_MEMORY, on disk beyond), aborting once
+    ``max_bytes`` is exceeded. Returns the rewound file, its size and the
+    SHA-256 of its bytes (hashed as they stream); the caller owns closing it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MAX_MEMORY)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with get_http_client().stream("GET", audio_url, timeout=AUDIO_DOWNLOAD_TIMEOUT_SECONDS) as resp:
+            if resp.status_code != 200:
+                raise _DownloadError(resp.status_code)
+            declared = int(resp.headers.get("content-length") or 0)
+            if declared > max_bytes:
+                raise _AudioTooLarge(declared, max_bytes)
+            async for chunk in resp.aiter_bytes(AUDIO_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _AudioTooLarge(size, max_bytes)
+                hasher.update(chunk)
+                spool.write(chunk)
+        spool.seek(0)
+        return spool, size, hasher.hexdigest()
+    except BaseException:
+        spool.close()
+        raise
+
+
+_WHISPER_MODEL = "whisper-1"
+
+
+async def _whisper(file) -> str:
+    # The file object is streamed by the multipart encoder, not read whole
+    resp = await llm_gateway.transcribe(
+        _WHISPER_MODEL,
+        file=file,
+        timeout=60,
+    )
+    return resp.text
 
 
-# OPENAI_API_KEY =os.getenv("OPENAI_API_KEY")
+async def _transcribe_spool(spool: BinaryIO, filename: str, size: int) -> str:
+    """
+    Short recordings (or anything that isn't MP3) go up in one request. Long
+    MP3s, and MP3s over Whisper's upload limit, are cut into overlapping
+    frame-aligned segments, transcribed concurrently (at most
+    AUDIO_TRANSCRIBE_CONCURRENCY in flight, so at most that many segments in
+    memory) and stitched back in order. Anything over the limit that can't be
+    split raises _AudioTooLarge before uploading.
+    """
+    too_big = size > WHISPER_MAX_UPLOAD_BYTES
+    segments = []
+    if filename.endswith(".mp3"):
+        segments = await run_in_threadpool(
+            lambda: plan_segments(iter_frames(spool), AUDIO_SEGMENT_SECONDS, AUDIO_SEGMENT_OVERLAP_SECONDS)
+        )
+        if not segments or (segments[-1].end_time <= AUDIO_CHUNK_THRESHOLD_SECONDS and not too_big):
+            segments = []
 
-def transcribe_audio_from_url(patient_id, audio_url):
+    if len(segments) <= 1:
+        if too_big:
+            raise _AudioTooLarge(size, WHISPER_MAX_UPLOAD_BYTES)
+        spool.seek(0)
+        return await _whisper((filename, spool))
+
+    logger.info("Transcribing %d segments in parallel", len(segments))
+    sem = asyncio.Semaphore(AUDIO_TRANSCRIBE_CONCURRENCY)
+    read_lock = asyncio.Lock()  # segments share one file position
+
+    async def _one(idx, seg):
+        async with sem:
+            async with read_lock:
+                data = await run_in_threadpool(read_segment, spool, seg)
+            return await _whisper((f"segment{idx:03d}.mp3", data))
+
+    texts = await asyncio.gather(*[_one(i, seg) for i, seg in enumerate(segments)])
+    return stitch_transcripts(texts)
+
+
+async def transcribe_audio_from_url(patient_id, audio_url, timings: Optional[Dict[str, float]] = None):
+    """``timings``, if given, receives download/transcribe/store durations in ms."""
+    timings = timings if timings is not None else {}
     print(" Step 1: Starting transcription for patient:", patient_id)
     
     try:
         print(" Step 2: Downloading audio from:", audio_url)
-        audio_response = requests.get(audio_url, timeout=10)
-        if audio_response.status_code != 200:
-            print(" Audio download failed:", audio_response.status_code)
+        t0 = time.perf_counter()
+        try:
+            spool, size, digest = await _download_to_spool(audio_url, _max_bytes(_audio_filename(audio_url)))
+        except _DownloadError as e:
+            print(" Audio download failed:", e)
             return {"error": "Failed to download audio"}
+        except _AudioTooLarge as e:
+            print(" Audio too large:", e)
+            return {"error": "Audio file too large", "details": f"limit is {e.limit} bytes"}
+        timings["download_ms"] = (time.perf_counter() - t0) * 1000
+        print(" Step 3: Audio downloaded:", size, "bytes")
+
+        t0 = time.perf_counter()
+        cache_key = transcription_cache.cache_key(digest, _WHISPER_MODEL)
+        with spool:
+            transcript = await run_in_threadpool(transcription_cache.get, cache_key)
+            cached = transcript is not None
+            if cached:
+                print(" Step 4: Transcript served from cache:", digest[:12])
+            else:
+                print(" Step 4: Sending audio to OpenAI Whisper...")
+                try:
+                    transcript = await _transcribe_spool(spool, _audio_filename(audio_url), size)
+                except _AudioTooLarge as e:
+                    print(" Audio too large:", e)
+                    return {"error": "Audio file too large", "details": f"limit is {e.limit} bytes"}
+                except APIStatusError as e:
+                    print(" Whisper API error:", e.message)
+                    return {"error": "Transcription failed", "details": e.message}
+                await run_in_threadpool(transcription_cache.put, cache_key, transcript, size)
 
-        TEMP_FILE_PATH = "temp_audio.mp3"
-        with open(TEMP_FILE_PATH, "wb") as f:
-            f.write(audio_response.content)
-        print(" Step 3: Audio downloaded and saved")
-
-        print(" Step 4: Sending audio to OpenAI Whisper...")
-        with open(TEMP_FILE_PATH, "rb") as audio_file:
-            headers = {
-                "Authorization": f"Bearer {OPENAI_API_KEY}"
-            }
-            files = {
-                "file": audio_file,
-                "model": (None, "whisper-1")
-            }
-            whisper_response = requests.post(
-                "https://api.openai.com/v1/audio/transcriptions",
-                headers=headers,
-                files=files,
-                timeout=60
-            )
-
-        if whisper_response.status_code != 200:
-            print(" Whisper API error:", whisper_response.text)
-            return {"error": "Transcription failed", "details": whisper_response.text}
-
-        transcript = whisper_response.json()["text"]
+        timings["transcribe_ms"] = (time.perf_counter() - t0) * 1000
         print(" Step 5: Transcription complete:", transcript)
 
 
         #save transcript in db
-        store_transcript(db,patient_id,transcript)
+        t0 = time.perf_counter()
+        await run_in_threadpool(store_transcript, get_database(), patient_id, transcript)
+        timings["store_ms"] = (time.perf_counter() - t0) * 1000
 
         return {
             "patient_id": patient_id,
             "transcript": transcript,
+            "cached": cached,
             "message": "transcript saved successfully"
         }
 
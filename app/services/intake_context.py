@@ -0,0 +1,97 @@
+# app/services/intake_context.py
+"""
+Incremental, bounded conversation context for intake LLM turns.
+
+The user prompt is laid out so that consecutive turns of a session share the
+longest possible prefix (the static system prompt is sent first as its own
+message; then the per-session patient line, the findings summary and the
+Q/A transcript, which only ever grows at the end; the per-turn status comes
+last), which is what provider-side prompt-prefix caching keys on.
+
+To stop prompt tokens growing with every turn, once the verbatim part of the
+transcript passes ``INTAKE_CONTEXT_MAX_TOKENS`` the older turns are folded
+into a structured summary kept on the session (``s["context"]``): chief
+complaint, duration, severity, red flags, negatives and short findings. Only
+the last ``INTAKE_CONTEXT_KEEP_TURNS`` turns stay verbatim. Folding is done
+locally with the intake engine's slot rules (no extra LLM call) and only
+touches turns that haven't been folded yet.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import INTAKE_CONTEXT_MAX_TOKENS, INTAKE_CONTEXT_KEEP_TURNS
+from app.services import intake_engine
+from app.services.utils.tokens import count_tokens
+
+_NEGATIVE_ANSWER = re.compile(r"^\s*(no|nope|none|nothing|never|not really|denies|nil|na|n/a)\b", re.IGNORECASE)
+_MAX_ANSWER_CHARS = 160
+
+
+def new_context() -> Dict[str, Any]:
+    return {"summary": {}, "folded": 0}
+
+
+def _clip(text: Optional[str], limit: int = _MAX_ANSWER_CHARS) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _fold(summary: Dict[str, Any], question: str, answer: Optional[str]) -> None:
+    slot = intake_engine.classify(question)
+    summary.setdefault("asked", []).append(slot or _clip(question, 60))
+    for flag in intake_engine.red_flags(answer or ""):
+        if flag not in summary.setdefault("red_flags", []):
+            summary["red_flags"].append(flag)
+
+    if slot == "complaint":
+        summary["chief_complaint"] = _clip(answer)
+    elif slot == "onset":
+        summary["duration"] = _clip(answer, 80)
+    elif slot == "severity":
+        summary["severity"] = _clip(answer, 40)
+    elif _NEGATIVE_ANSWER.match(answer or ""):
+        summary.setdefault("negatives", []).append(slot or _clip(question, 60))
+    else:
+        summary.setdefault("findings", []).append(f"{slot or _clip(question, 60)}: {_clip(answer)}")
+
+
+def _turn_lines(i: int, question: str, answer: Optional[str]) -> str:
+    return f"Q{i}: {question}\nA{i}: {answer if answer is not None else ''}"
+
+
+def update(context: Dict[str, Any], qa_history: List[Tuple[str, Optional[str]]], model: str) -> None:
+    """Fold aged-out turns into the summary once the verbatim tail is over budget."""
+    folded = context.get("folded", 0)
+    tail = qa_history[folded:]
+    tail_tokens = sum(count_tokens(_turn_lines(i, q, a), model) for i, (q, a) in enumerate(tail, start=folded + 1))
+    if tail_tokens <= INTAKE_CONTEXT_MAX_TOKENS:
+        return
+    fold_upto = max(folded, len(qa_history) - INTAKE_CONTEXT_KEEP_TURNS)
+    summary = context.setdefault("summary", {})
+    for q, a in qa_history[folded:fold_upto]:
+        _fold(summary, q, a)
+    context["folded"] = fold_upto
+
+
+def build_user_block(
+    patient_line: str,
+    context: Optional[Dict[str, Any]],
+    qa_history: List[Tuple[str, Optional[str]]],
+    asked_count: int,
+) -> str:
+    folded = (context or {}).get("folded", 0)
+    parts = [patient_line]
+    if folded:
+        summary = json.dumps(context["summary"], ensure_ascii=False, separators=(",", ":"))
+        parts.append(f"Summary of Q1-Q{folded} (structured findings; these questions were already asked):\n{summary}\n")
+    lines = [_turn_lines(i, q, a) for i, (q, a) in enumerate(qa_history[folded:], start=folded + 1)]
+    transcript = "\n".join(lines) if lines else "(no prior Q/A)"
+    parts.append(f"Transcript so far:\n{transcript}\n\n")
+    # Per-turn values last, so everything above is a stable prefix across turns
+    parts.append(
+        f"Questions asked so far: {asked_count}\n"
+        f"Target max: 10; Absolute max: 13 (only if necessary).\n"
+        "Return STRICT JSON only."
+    )
+    return "".join(parts)
@@ -0,0 +1,182 @@
+# app/services/intake_engine.py
+"""
+Local, rule-based intake question engine.
+
+Used when the LLM misses its deadline (or keeps failing), so the patient is
+never left waiting. It is a small symptom-keyword decision tree: the
+complaint(s) mentioned in the answers so far select topic branches, each with
+ordered follow-up "slots" (duration, severity, ...); general history slots
+come after. A slot counts as covered when any earlier question — the
+engine's own or the LLM's — already asked about it, so the two can be mixed
+freely within one session.
+"""
+import re
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Slot(NamedTuple):
+    id: str
+    question: str
+    asked_if: str  # regex over earlier question texts that means "already covered"
+
+
+_OPENING = Slot("complaint", "What brings you in today?", r"brings you|main (concern|complaint|problem)|how can (i|we) help")
+
+# Asked for every complaint, right after the opening question
+_CORE: Sequence[Slot] = (
+    Slot("onset", "When did this start, and did it come on suddenly or gradually?", r"how long|when did (this|it|the)|since when|onset|duration"),
+    Slot("severity", "On a scale of 1 to 10, how severe is it right now?", r"scale|severe|severity|how bad|intensity"),
+)
+
+# (topic, trigger regex over answers, follow-up slots)
+_TOPICS: Sequence[Tuple[str, str, Sequence[Slot]]] = (
+    ("chest_pain", r"chest (pain|tightness|pressure)|pain in (my|the) chest|palpitation", (
+        Slot("chest_radiation", "Does the chest pain spread to your arm, jaw or back?", r"spread|radiat|\barm\b|jaw"),
+        Slot("chest_exertion", "Does it get worse with exertion or improve with rest?", r"exert|exercise|climb"),
+        Slot("chest_sob", "Are you short of breath or sweating with it?", r"short(ness)? of breath|breathless|sweat"),
+    )),
+    ("breathing", r"short(ness)? of breath|breathless|wheez|can'?t breathe|difficulty breathing|asthma", (
+        Slot("breath_rest", "Are you breathless at rest, or only when active?", r"at rest|when active|exert"),
+        Slot("breath_wheeze", "Do you hear wheezing or have chest tightness?", r"wheez|tight"),
+    )),
+    ("headache", r"headache|head ?ache|migraine|head (pain|hurts)", (
+        Slot("head_location", "Where in your head is the pain — front, back, one side or all over?", r"where.*head|which side"),
+        Slot("head_redflags", "Any vision changes, neck stiffness, vomiting or weakness with it?", r"vision|neck stiff|weakness"),
+        Slot("head_triggers", "Does anything trigger it or make it better, like light, noise, sleep or medicine?", r"trigger|light or noise|makes? it better"),
+    )),
+    ("fever", r"fever|temperature|chills|feverish", (
+        Slot("fever_max", "How high has your temperature been, if you measured it?", r"how high|temperature|measured|thermometer"),
+        Slot("fever_pattern", "Is the fever constant or does it come and go, with chills or sweating?", r"constant|come and go|chills|pattern"),
+    )),
+    ("cough", r"cough|phlegm|sputum|cold|runny nose|congestion", (
+        Slot("cough_type", "Is the cough dry, or are you bringing up phlegm? What colour?", r"dry|phlegm|sputum|mucus|colou?r"),
+        Slot("cough_blood", "Have you coughed up any blood?", r"cough(ed)? up.*blood"),
+    )),
+    ("throat", r"sore throat|throat (pain|hurts)|difficulty swallowing|tonsil", (
+        Slot("throat_swallow", "Is it painful or difficult to swallow food or liquids?", r"swallow"),
+    )),
+    ("abdomen", r"stomach|abdom|belly|tummy|gastric|acidity|bloat", (
+        Slot("abd_location", "Where exactly in your abdomen is the pain?", r"where.*(abdom|stomach|belly)|which part of (your|the) (abdomen|stomach)"),
+        Slot("abd_food", "Is the pain related to eating, better or worse after meals?", r"eating|meals?\b"),
+        Slot("abd_bowel", "Any change in bowel habits, blood in stool or black stools?", r"bowel|stool|constipat|diarrh"),
+    )),
+    ("gi_upset", r"vomit|nausea|diarrh|loose (motion|stool)|throwing up", (
+        Slot("gi_frequency", "How many times a day is this happening?", r"how many times|how often|frequency"),
+        Slot("gi_hydration", "Are you able to keep fluids down and passing urine normally?", r"fluids|urine|dehydrat|drink"),
+    )),
+    ("urinary", r"urin|burning|pee|bladder", (
+        Slot("uri_symptoms", "Any burning, increased frequency or blood when passing urine?", r"urin"),
+    )),
+    ("musculoskeletal", r"back pain|joint|knee|shoulder|neck pain|sprain|muscle|swelling", (
+        Slot("msk_injury", "Did this start after an injury, fall or strain?", r"injur|fall|strain|accident"),
+        Slot("msk_function", "Is it limiting your movement or daily activities?", r"movement|walk|daily activit"),
+    )),
+    ("skin", r"rash|itch|skin|hives|spots|lesion", (
+        Slot("skin_spread", "Where is the rash, and is it spreading?", r"where.*rash|spread"),
+        Slot("skin_exposure", "Any new soaps, foods, medicines or plants before it started?", r"new (soap|food|medic|product)|exposure|contact with"),
+    )),
+    ("dizziness", r"dizz|vertigo|faint|lightheaded|light-headed|blackout", (
+        Slot("dizzy_type", "Does the room spin, or do you feel like you might faint?", r"spin|faint"),
+        Slot("dizzy_trigger", "Does it happen when standing up or turning your head?", r"stand|turning"),
+    )),
+    ("fatigue", r"tired|fatigue|weak|exhaust|low energy", (
+        Slot("fatigue_sleep", "How are you sleeping, and has your weight or appetite changed?", r"sleep|weight|appetite"),
+    )),
+)
+
+# General history, after the complaint-specific branches
+_HISTORY: Sequence[Slot] = (
+    Slot("associated", "Have you noticed any other symptoms along with this?", r"other symptoms|anything else.*symptom|associated"),
+    Slot("medications", "Are you taking any medications or supplements?", r"medication|supplement|taking any"),
+    Slot("allergies", "Do you have any known allergies?", r"allerg"),
+    Slot("chronic", "Any chronic conditions, such as diabetes, hypertension or asthma?", r"chronic|diabetes|hypertension|condition"),
+    Slot("previous", "Have you had similar episodes before?", r"similar episode|had this before|happened before|previous(ly)?|prior episode"),
+    Slot("final", "Is there anything else the doctor should know right now?", r"anything else"),
+)
+
+# (label, pattern over answers) for findings the doctor should see first
+_RED_FLAGS: Sequence[Tuple[str, str]] = (
+    ("chest pain", r"chest (pain|tightness|pressure)"),
+    ("breathlessness", r"short(ness)? of breath|breathless|can'?t breathe|difficulty breathing"),
+    ("fainting", r"faint|blackout|passed out|unconscious"),
+    ("bleeding", r"blood in (stool|urine|vomit)|coughed up blood|coughing (up )?blood|black stool|vomiting blood"),
+    ("neuro deficit", r"weakness on one side|numbness|slurred speech|confusion|seizure|fits"),
+    ("worst headache", r"worst headache|sudden severe headache|thunderclap"),
+    ("neck stiffness", r"neck stiff|stiff neck"),
+    # A reading needs a unit (103-109 °F, 40-42 °C) or a temperature keyword right before it,
+    # so ages and durations ("I am 40", "fever for 41 hours") don't count
+    ("high fever", r"\b10[3-9](\.\d)?\s*(°\s*f?|degrees?(\s+f(ahrenheit)?)?\b|f\b)"
+                   r"|\b4[0-2](\.\d)?\s*(°\s*c?|degrees?(\s+c(elsius)?)?\b|c\b)"
+                   r"|\btemp(erature)?\s*(of|was|is|at|around|reached|:)?\s*(10[3-9]|4[0-2])(\.\d)?\b"),
+    ("self-harm", r"suicid|self[- ]harm|kill myself"),
+)
+
+# A negator followed by at most two more words, all in the same clause: the
+# scope ends at punctuation and at clause words ("no fever but cough")
+_NEGATION = re.compile(
+    r"(\b(no|not|never|denies|deny|without|none)\b|n't\b)"
+    r"(\s+(?!(but|and|though|although|however|except|yet)\b)[\w'-]+){0,2}\s*$",
+    re.IGNORECASE,
+)
+
+
+def _mentioned(pattern: str, text: str) -> bool:
+    """``pattern`` occurs in ``text`` at least once without a negation just before it."""
+    for m in re.finditer(pattern, text, re.IGNORECASE):
+        if not _NEGATION.search(text[max(0, m.start() - 40):m.start()]):
+            return True
+    return False
+
+
+def _covered(slot: Slot, asked: Iterable[str]) -> bool:
+    return any(q == slot.question or re.search(slot.asked_if, q, re.IGNORECASE) for q in asked)
+
+
+def classify(question: str) -> Optional[str]:
+    """Slot id an asked question covers (engine or LLM wording), if any."""
+    slots = [_OPENING, *_CORE, *(slot for _, _, branch in _TOPICS for slot in branch), *_HISTORY]
+    for slot in slots:
+        if _covered(slot, [question]):
+            return slot.id
+    return None
+
+
+def red_flags(text: str) -> List[str]:
+    """Red-flag labels mentioned (not negated) in ``text``."""
+    return [label for label, pattern in _RED_FLAGS if _mentioned(pattern, text or "")]
+
+
+def detect_topics(answers: Iterable[str]) -> List[str]:
+    """Complaint topics mentioned (not negated) in the answers, in order of first mention."""
+    found: List[str] = []
+    for answer in answers:
+        for topic, trigger, _ in _TOPICS:
+            if topic not in found and _mentioned(trigger, answer or ""):
+                found.append(topic)
+    return found
+
+
+def next_question(qa_history: Sequence[Tuple[str, Optional[str]]], max_questions: int) -> Optional[str]:
+    """
+    Next question given the ``(question, answer)`` pairs so far, or None when
+    the tree is exhausted or ``max_questions`` have been asked.
+    """
+    if len(qa_history) >= max_questions:
+        return None
+    asked = [q for q, _ in qa_history]
+    if not asked:
+        return _OPENING.question
+
+    topics = detect_topics(a for _, a in qa_history)
+    branches = {t: slots for t, _, slots in _TOPICS}
+    plan: List[Slot] = [_OPENING]
+    if topics:
+        plan.extend(_CORE)
+    for topic in topics:
+        plan.extend(branches[topic])
+    plan.extend(_HISTORY)
+
+    for slot in plan:
+        if not _covered(slot, asked):
+            return slot.question
+    return None
@@ -1,53 +1,43 @@
 # app/services/intake_orchestrator.py
 from __future__ import annotations
+import asyncio
+import copy
 import hashlib
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Awaitable, Callable, Optional, List, Tuple
 from uuid import uuid4
 import json
-import os
+import logging
 import re
 
-from pymongo import ReturnDocument
-
+from starlette.concurrency import run_in_threadpool
+
+from app import metrics
+from app.config import (
+    INTAKE_LLM_DEADLINE_MS,
+    INTAKE_LLM_MAX_SKIP_TURNS,
+    INTAKE_QUESTION_CACHE_ENABLED,
+    INTAKE_QUESTION_CACHE_MAX_TURNS,
+    INTAKE_QUESTION_CACHE_MAX_ENTRIES,
+    INTAKE_QUESTION_CACHE_TTL_SECONDS,
+)
+from app.services import intake_context, intake_engine, llm_gateway
 from app.db import get_database
-from app.models.patient import get_patient_by_name_mobile, insert_patient_record
+from app.models.patient import get_patient_by_name_mobile, get_patient_info, insert_patient_record
 from app.schemas.intake_schema import PatientInfo
+from app.services.session_store import get_session_store
+from app.services.utils.json_stream import JsonObjectStream
+from app.services.utils.ttl_cache import TTLCache
 
-# ---------- OpenAI client (new SDK) ----------
-from openai import OpenAI
-
-def _get_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        # Lazily fail with a clear message only when needed
-        raise RuntimeError("OPENAI_API_KEY not set. Set it or load via .env before running.")
-    return OpenAI(api_key=api_key)
-
-
+logger = logging.getLogger(__name__)
 
 
-# In-memory session store (resets on server restart)
-_SESSIONS: Dict[str, Dict[str, Any]] = {}
-
 # Hard rules
 _TARGET_QUESTIONS = 10          # normal cap
 _EXTRA_ALLOWED_MAX = 3          # allow up to 2-3 more if info incomplete
 _HARD_CAP = _TARGET_QUESTIONS + _EXTRA_ALLOWED_MAX  # absolute max
 
-_FALLBACK_QUESTIONS: List[str] = [
-    "What brings you in today?",
-    "How long have you had these symptoms?",
-    "Where is the pain located, if any?",
-    "Any fever, cough, or shortness of breath?",
-    "Any known allergies?",
-    "Are you taking any medications or supplements?",
-    "Any prior similar episodes?",
-    "Any recent travel or exposure to sick contacts?",
-    "Any chronic conditions (e.g., diabetes, hypertension)?",
-    "Is there anything else the doctor should know right now?",
-]
-
 # ---------- System prompt for the LLM ----------
 _SYSTEM_PROMPT = """
  System Role: You are a professional general physician AI assistant conducting structured patient intake interviews.
@@ -121,42 +111,117 @@ def _extract_json(s: str) -> dict:
             pass
     raise ValueError("Could not parse LLM output as JSON")
 
-def _llm_next_question(
+_INTAKE_MODEL = "gpt-4o-mini"
+
+# Identifies the prompt a cached question was generated with
+_PROMPT_VERSION = hashlib.sha256(f"{_INTAKE_MODEL}\n{_SYSTEM_PROMPT}".encode()).hexdigest()[:12]
+
+# Opening turns depend only on demographics and a short (usually empty) history,
+# so their questions are shared across sessions
+_question_cache = TTLCache(
+    INTAKE_QUESTION_CACHE_MAX_ENTRIES, INTAKE_QUESTION_CACHE_TTL_SECONDS, name="intake_question_cache"
+)
+
+def _age_band(age: Any) -> str:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    for upper, band in ((2, "0-1"), (13, "2-12"), (18, "13-17"), (30, "18-29"), (45, "30-44"), (60, "45-59"), (75, "60-74")):
+        if age < upper:
+            return band
+    return "75+"
+
+def _gender(gender: Any) -> str:
+    g = str(gender or "").strip().lower()
+    if g in ("m", "male", "man", "boy"):
+        return "male"
+    if g in ("f", "female", "woman", "girl"):
+        return "female"
+    return g or "unknown"
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").lower().split())
+
+def _question_cache_key(patient_info: dict, qa_history: List[Tuple[str, str]]) -> Optional[tuple]:
+    """Cache key for this turn, or None when the turn shouldn't be cached."""
+    if not INTAKE_QUESTION_CACHE_ENABLED or len(qa_history) >= INTAKE_QUESTION_CACHE_MAX_TURNS:
+        return None
+    prefix = "\n".join(f"{_normalize(q)}\t{_normalize(a)}" for q, a in qa_history)
+    return (
+        _PROMPT_VERSION,
+        _age_band(patient_info.get("age")),
+        _gender(patient_info.get("gender")),
+        hashlib.sha256(prefix.encode()).hexdigest()[:16],
+    )
+
+# Receives each newly generated piece of the question text while it streams
+OnDelta = Callable[[str], Awaitable[None]]
+
+async def _stream_llm(messages: List[Dict[str, str]], on_delta: OnDelta) -> Tuple[str, Any]:
+    """Streamed chat call; forwards next_question text as it arrives. Returns (raw text, usage)."""
+    parser = JsonObjectStream()
+    usage = None
+    sent = 0
+    async for chunk in llm_gateway.chat_stream(_INTAKE_MODEL, temperature=0.2, messages=messages):
+        if chunk.usage:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        parser.feed(chunk.choices[0].delta.content or "")
+        partial = parser.partial()
+        if partial and partial[0] == "next_question" and len(partial[1]) > sent:
+            await on_delta(partial[1][sent:])
+            sent = len(partial[1])
+    return parser.text, usage
+
+async def _llm_next_question(
     patient_info: dict,
     qa_history: List[Tuple[str, str]],
     asked_count: int,
+    context: Optional[Dict[str, Any]] = None,
+    on_delta: Optional[OnDelta] = None,
 ) -> dict:
     """
     Ask the LLM for the next single question (or signal 'done').
     Returns parsed JSON dict with: next_question, done, needs_extra, reason
+    (plus "usage" when the model was actually called). Opening turns are
+    served from _question_cache when possible. ``context`` is the session's
+    rolling context (see intake_context) and is updated in place. With
+    ``on_delta`` the response is streamed and the question text is passed to
+    it piece by piece as it is generated.
     """
-    client = _get_client()
-
-    # Build a compact transcript
-    transcript_lines = []
-    for i, (q, a) in enumerate(qa_history, start=1):
-        transcript_lines.append(f"Q{i}: {q}")
-        transcript_lines.append(f"A{i}: {a if a is not None else ''}")
-    transcript = "\n".join(transcript_lines) if transcript_lines else "(no prior Q/A)"
-
-    user_block = (
-        f"Patient: Name={patient_info.get('name')}, Age={patient_info.get('age')}, "
-        f"Gender={patient_info.get('gender')}\n"
-        f"Questions asked so far: {asked_count}\n"
-        f"Target max: 10; Absolute max: 13 (only if necessary).\n"
-        f"Transcript so far:\n{transcript}\n\n"
-        "Return STRICT JSON only."
-    )
-
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        messages=[
-            {"role": "system", "content": _SYSTEM_PROMPT},
-            {"role": "user", "content": user_block},
-        ],
-    )
-    raw = resp.choices[0].message.content or ""
+    cache_key = _question_cache_key(patient_info, qa_history)
+    if cache_key is not None:
+        cached = _question_cache.get(cache_key)
+        if cached is not None:
+            if on_delta is not None and cached["next_question"]:
+                await on_delta(cached["next_question"])
+            return dict(cached)
+
+    if cache_key is not None:
+        # Shared across patients: only what the key captures goes into the prompt
+        patient_line = f"Patient: Age group={cache_key[1]}, Gender={cache_key[2]}\n"
+    else:
+        patient_line = (
+            f"Patient: Name={patient_info.get('name')}, Age={patient_info.get('age')}, "
+            f"Gender={patient_info.get('gender')}\n"
+        )
+    if context is not None:
+        intake_context.update(context, qa_history, _INTAKE_MODEL)
+    user_block = intake_context.build_user_block(patient_line, context, qa_history, asked_count)
+
+    messages = [
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": user_block},
+    ]
+    t0 = time.perf_counter()
+    if on_delta is None:
+        resp = await llm_gateway.chat(_INTAKE_MODEL, temperature=0.2, messages=messages)
+        raw, usage = resp.choices[0].message.content or "", resp.usage
+    else:
+        raw, usage = await _stream_llm(messages, on_delta)
+    llm_ms = (time.perf_counter() - t0) * 1000
     data = _extract_json(raw)
 
     # Basic shape guard
@@ -167,6 +232,16 @@ def _llm_next_question(
     data["next_question"] = (data.get("next_question") or "").strip()
     data["done"] = bool(data.get("done"))
     data["needs_extra"] = bool(data.get("needs_extra"))
+    if cache_key is not None and data["next_question"]:
+        _question_cache.set(cache_key, dict(data))
+
+    prompt_tokens = usage.prompt_tokens if usage else 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    metrics.observe("intake.prompt_tokens", prompt_tokens)
+    metrics.observe("intake.llm_ms", llm_ms)
+    metrics.incr("intake.cached_prompt_tokens", cached_tokens)
+    data["usage"] = {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "llm_ms": round(llm_ms, 1)}
     return data
 
 
@@ -179,10 +254,6 @@ def _generate_patient_id(db, name: str, mobile: str) -> str:
     encrypted_id = hash_object.hexdigest()[:12]  # Use first 12 chars for brevity
     return encrypted_id
 
-def _get_patient_info_by_id(db, patient_id: str) -> Optional[dict]:
-    doc = db.clinicAi.find_one({"patient_id": patient_id}, {"_id": 0, "patient_info": 1})
-    return doc.get("patient_info") if doc else None
-
 # ---------- API used by your router ----------
 
 
@@ -202,7 +273,6 @@ def create_patient_record(patient_info: PatientInfo) -> dict:
     record = {
         "patient_id": patient_id,
         "patient_info": patient_info.model_dump(),  # Correct for Pydantic v2
-        "visits": []
     }
 
     insert_patient_record(db, record)
@@ -211,12 +281,21 @@ def create_patient_record(patient_info: PatientInfo) -> dict:
 
 
 #start intake session 
-def start_intake_session(patient_id: str) -> str:
+async def start_intake_session(patient_id: str) -> str:
     """
-    Start a session. LLM will choose each next question on demand.
+    Start a session. LLM will choose each next question on demand; the first
+    one (which depends on patient_info alone) is prepared in the background
+    right away.
     """
     session_id = str(uuid4())
-    _SESSIONS[session_id] = {
+    session = _new_session(patient_id)
+    # Written through so the next request can be served by any worker
+    await run_in_threadpool(get_session_store().put, session_id, session, True)
+    _prefetch(session_id, session)
+    return session_id
+
+def _new_session(patient_id: str) -> Dict[str, Any]:
+    return {
         "patient_id": patient_id,
         "q_index": 0,                # how many have been asked
         "answers": {},               # qid -> text
@@ -224,19 +303,66 @@ def start_intake_session(patient_id: str) -> str:
         "target_max": _TARGET_QUESTIONS,
         "extras_used": 0,
         "created_at": datetime.utcnow(),
-        "llm_disabled": False,       # if LLM errors, we fall back
+        "llm_failures": 0,           # consecutive LLM errors/timeouts
+        "llm_retry_at": 0,           # q_index from which the LLM is tried again
+        "sources": [],               # per question: "llm" or "engine"
+        "context": intake_context.new_context(),  # rolling summary of older turns
+        "llm_turns": [],             # per LLM call: prompt/cached tokens, latency
     }
-    return session_id
 
-def get_next_intake_question(session_id: str) -> Optional[dict]:
+async def _load_session(session_id: str) -> Optional[Dict[str, Any]]:
+    return await run_in_threadpool(get_session_store().get, session_id)
+
+async def _hedged_next_question(
+    s: Dict[str, Any], pi: dict, qa_history: List[Tuple[str, str]], on_delta: Optional[OnDelta] = None
+) -> Tuple[Optional[str], bool, bool, str]:
     """
-    Returns the next question dict: {id, text, index, total}
-    If done, returns None.
+    (question, done, allow_extra, source) for the next turn. The LLM gets
+    INTAKE_LLM_DEADLINE_MS; if it errors or runs late, the local engine
+    answers instead, so time-per-question is bounded by the deadline. After a
+    failure the LLM sits out a growing number of turns (capped at
+    INTAKE_LLM_MAX_SKIP_TURNS) and is then tried again.
+    """
+    asked = s["q_index"]
+    t0 = time.perf_counter()
+    if asked >= s.get("llm_retry_at", 0):
+        context = s.setdefault("context", intake_context.new_context())
+        try:
+            data = await asyncio.wait_for(
+                _llm_next_question(pi, qa_history, asked_count=asked, context=context, on_delta=on_delta),
+                INTAKE_LLM_DEADLINE_MS / 1000,
+            )
+            s["llm_failures"] = 0
+            if "usage" in data:
+                s.setdefault("llm_turns", []).append({"turn": asked + 1, **data["usage"]})
+            metrics.incr("intake.llm.served")
+            metrics.observe("intake.question_ms", (time.perf_counter() - t0) * 1000)
+            return (data.get("next_question") or "").strip(), bool(data.get("done")), bool(data.get("needs_extra")), "llm"
+        except asyncio.TimeoutError:
+            metrics.incr("intake.llm.timeouts")
+        except Exception as e:
+            logger.warning("Intake LLM failed, using local engine: %s", e)
+            metrics.incr("intake.llm.errors")
+        s["llm_failures"] = s.get("llm_failures", 0) + 1
+        s["llm_retry_at"] = asked + 1 + min(s["llm_failures"] - 1, INTAKE_LLM_MAX_SKIP_TURNS)
+    else:
+        metrics.incr("intake.llm.skipped")
+
+    # The engine never grants extra questions beyond the target
+    next_q_text = intake_engine.next_question(qa_history, max_questions=s["target_max"])
+    metrics.incr("intake.engine.served")
+    metrics.observe("intake.question_ms", (time.perf_counter() - t0) * 1000)
+    return next_q_text, next_q_text is None, False, "engine"
+
+async def _next_question(
+    s: Dict[str, Any], patient_info: Optional[dict] = None, on_delta: Optional[OnDelta] = None
+) -> Optional[dict]:
+    """
+    Advance session ``s`` (mutated in place) and return the next question
+    dict: {id, text, index, total}. If done, returns None. ``patient_info``
+    is looked up when not supplied; ``on_delta`` streams the LLM's question
+    text (the returned dict is authoritative, e.g. if the engine took over).
     """
-    s = _SESSIONS.get(session_id)
-    if not s:
-        return None
-
     asked = s["q_index"]
     total_cap = s["target_max"]
 
@@ -248,8 +374,9 @@ def get_next_intake_question(session_id: str) -> Optional[dict]:
         # Already at the (possibly extended) cap → we're done
         return None
 
-    db = get_database()
-    pi = _get_patient_info_by_id(db, s["patient_id"]) or {}
+    pi = patient_info
+    if pi is None:
+        pi = await run_in_threadpool(get_patient_info, get_database(), s["patient_id"]) or {}
 
     # Build history as pairs (Q, A) for the LLM
     qa_history: List[Tuple[str, str]] = []
@@ -257,27 +384,7 @@ def get_next_intake_question(session_id: str) -> Optional[dict]:
         qid = f"q{i}"
         qa_history.append((q_text, s["answers"].get(qid)))
 
-    # Try LLM (unless disabled due to prior errors)
-    next_q_text: Optional[str] = None
-    allow_extra = False
-    done = False
-    if not s["llm_disabled"]:
-        try:
-            data = _llm_next_question(pi, qa_history, asked_count=asked)
-            next_q_text = (data.get("next_question") or "").strip()
-            done = bool(data.get("done"))
-            allow_extra = bool(data.get("needs_extra"))
-        except Exception:
-            # Disable LLM for this session and fall back
-            s["llm_disabled"] = True
-
-    # Fallback logic
-    if s["llm_disabled"]:
-        if asked < len(_FALLBACK_QUESTIONS):
-            next_q_text = _FALLBACK_QUESTIONS[asked]
-            done = False
-        else:
-            done = True
+    next_q_text, done, allow_extra, source = await _hedged_next_question(s, pi, qa_history, on_delta)
 
     # Apply caps/extra rules
     if done:
@@ -295,41 +402,120 @@ def get_next_intake_question(session_id: str) -> Optional[dict]:
 
     # Register the question we are about to ask
     s["questions"].append(next_q_text)
+    s.setdefault("sources", []).append(source)
     s["q_index"] += 1
     q_id = f"q{len(s['questions'])}"
     return {"id": q_id, "text": next_q_text, "index": len(s["questions"]), "total": total_cap}
 
-def submit_intake_answer(session_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+# ---------- Prefetch ----------
+# Next questions are prepared by background tasks as soon as their inputs are
+# known (session start / answer received) and parked in the session under
+# "prepared" until a client asks for them. _inflight lets requests in this
+# process wait for a preparation that's already running instead of repeating it.
+# Requests on other workers can't wait for it, so the result is only stored if
+# the session is still at the turn it was prepared for; otherwise it's dropped.
+_inflight: Dict[str, asyncio.Task] = {}
+
+async def _prepare(session_id: str, s: Dict[str, Any]) -> Optional[dict]:
+    expected = {"q_index": s["q_index"], "questions": list(s["questions"])}
+    next_q = await _next_question(s)
+    s["prepared"] = {"question": next_q}
+    stored = await run_in_threadpool(get_session_store().put_if_match, session_id, s, expected)
+    if not stored:
+        # Another worker moved the session on meanwhile; its state wins
+        metrics.incr("intake.prefetch.discarded")
+        return None
+    return next_q
+
+def _prefetch(session_id: str, s: Dict[str, Any]) -> asyncio.Task:
+    task = asyncio.create_task(_prepare(session_id, s))
+    _inflight[session_id] = task
+
+    def _done(t: asyncio.Task) -> None:
+        if _inflight.get(session_id) is t:
+            del _inflight[session_id]
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("Intake prefetch for session %s failed: %s", session_id, t.exception())
+    task.add_done_callback(_done)
+    return task
+
+async def _settle(session_id: str) -> None:
+    """Wait for this process's in-flight preparation for the session, if any."""
+    task = _inflight.get(session_id)
+    if task is not None:
+        t0 = time.perf_counter()
+        await asyncio.wait([task])
+        metrics.observe("intake.prefetch.wait_ms", (time.perf_counter() - t0) * 1000)
+
+async def get_next_intake_question(session_id: str) -> Optional[dict]:
+    """
+    Returns the next question dict: {id, text, index, total}
+    If done, returns None. A question prepared in the background is returned
+    as-is (instantly once ready); otherwise one is generated now.
+    """
+    await _settle(session_id)
+    s = await _load_session(session_id)
+    if not s:
+        return None
+    prepared = s.pop("prepared", None)
+    if prepared is not None:
+        metrics.incr("intake.prefetch.hits")
+        await run_in_threadpool(get_session_store().put, session_id, s)
+        return prepared["question"]
+
+    metrics.incr("intake.prefetch.misses")
+    next_q = await _next_question(s)
+    await run_in_threadpool(get_session_store().put, session_id, s)
+    return next_q
+
+async def submit_intake_answer(session_id: str, payload: Dict[str, Any], wait: bool = True) -> Dict[str, Any]:
     """
     Saves the current question's answer and advances.
     Payload: {"value": "...user answer..."}
-    Returns: {completed: bool, next_question: Optional[dict]}
+    Returns: {completed: bool, next_question: Optional[dict], pending: bool}
+
+    Generation of the next question starts immediately. With ``wait=False``
+    the call returns without it (``pending: true``) and the client fetches it
+    from GET /intake/next-question, which returns it as soon as it's ready.
     """
-    s = _SESSIONS.get(session_id)
+    await _settle(session_id)
+    s = await _load_session(session_id)
     if not s:
         return {"error": "invalid_session"}
 
-    current_idx = len(s["questions"])
-    if current_idx == 0:
-        # No question asked yet
-        next_q = get_next_intake_question(session_id)
-        return {"completed": next_q is None, "next_question": next_q}
-
-    # Save answer to the last asked question
-    q_id = f"q{current_idx}"
-    s["answers"][q_id] = payload.get("value")
-
-    # Ask next one
-    next_q = get_next_intake_question(session_id)
-    return {"completed": next_q is None, "next_question": next_q}
+    # A prepared question is already registered in the session but hasn't been shown yet
+    prepared = s.pop("prepared", None)
+    undelivered = prepared is not None and prepared["question"] is not None
+    current_idx = len(s["questions"]) - (1 if undelivered else 0)
+    if current_idx > 0:
+        # Save answer to the last asked question
+        q_id = f"q{current_idx}"
+        s["answers"][q_id] = payload.get("value")
+
+    if undelivered:
+        await run_in_threadpool(get_session_store().put, session_id, s)
+        return {"completed": False, "next_question": prepared["question"], "pending": False}
+
+    if not wait:
+        await run_in_threadpool(get_session_store().put, session_id, s)
+        _prefetch(session_id, s)
+        return {"completed": False, "next_question": None, "pending": True}
+
+    # Ask next one (or the first one if nothing was asked yet)
+    next_q = await _next_question(s)
+    await run_in_threadpool(get_session_store().put, session_id, s)
+    return {"completed": next_q is None, "next_question": next_q, "pending": False}
 
 def get_intake_state(session_id: str) -> Optional[dict]:
     """
     Returns a snapshot of the session, including asked questions, answers, and caps.
     """
-    s = _SESSIONS.get(session_id)
+    s = get_session_store().get(session_id)
     if not s:
         return None
+    return _snapshot(s)
+
+def _snapshot(s: Dict[str, Any]) -> dict:
     # Redact nothing here; this is an internal summary endpoint.
     return {
         "patient_id": s["patient_id"],
@@ -338,6 +524,87 @@ def get_intake_state(session_id: str) -> Optional[dict]:
         "extras_used": s["extras_used"],
         "questions": s["questions"],
         "answers": s["answers"],
-        "llm_disabled": s["llm_disabled"],
+        "sources": s.get("sources", []),
+        "llm_failures": s.get("llm_failures", 0),
+        "llm_turns": s.get("llm_turns", []),
         "created_at": s["created_at"].isoformat(),
     }
+
+
+# ---------- WebSocket channel ----------
+
+class IntakeChannel:
+    """
+    One intake session held in memory for the lifetime of a WebSocket
+    connection: the session and patient info are loaded once, every turn
+    works on the in-memory copy, and state is written back to the session
+    store by a background task (latest snapshot wins) so the socket never
+    waits on storage. The session stays compatible with the REST endpoints.
+    """
+
+    def __init__(self, session_id: str, session: Dict[str, Any], patient_info: dict):
+        self.session_id = session_id
+        self.s = session
+        self.patient_info = patient_info
+        self._latest: Optional[Dict[str, Any]] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def open(cls, session_id: Optional[str] = None, patient_id: Optional[str] = None) -> Optional["IntakeChannel"]:
+        """Resume ``session_id`` or start a new session for ``patient_id``; None if neither works."""
+        if session_id:
+            await _settle(session_id)
+            s = await _load_session(session_id)
+            if not s:
+                return None
+        elif patient_id:
+            session_id, s = str(uuid4()), _new_session(patient_id)
+            await run_in_threadpool(get_session_store().put, session_id, s, True)
+        else:
+            return None
+        pi = await run_in_threadpool(get_patient_info, get_database(), s["patient_id"]) or {}
+        return cls(session_id, s, pi)
+
+    def pending_question(self) -> Optional[dict]:
+        """The question the patient should be looking at now (on (re)connect), if one is already chosen."""
+        prepared = self.s.pop("prepared", None)
+        if prepared is not None and prepared["question"] is not None:
+            self._save()
+            return prepared["question"]
+        n = len(self.s["questions"])
+        if n and f"q{n}" not in self.s["answers"]:
+            return {"id": f"q{n}", "text": self.s["questions"][-1], "index": n, "total": self.s["target_max"]}
+        return None
+
+    def answer(self, value: Any) -> None:
+        n = len(self.s["questions"])
+        if n > 0:
+            self.s["answers"][f"q{n}"] = value
+            self._save()
+
+    async def next_question(self, on_delta: Optional[OnDelta] = None) -> Optional[dict]:
+        next_q = await _next_question(self.s, self.patient_info, on_delta)
+        self._save()
+        return next_q
+
+    def state(self) -> dict:
+        return _snapshot(self.s)
+
+    def _save(self) -> None:
+        self._latest = copy.deepcopy(self.s)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_back())
+
+    async def _write_back(self) -> None:
+        while self._latest is not None:
+            snapshot, self._latest = self._latest, None
+            try:
+                await run_in_threadpool(get_session_store().put, self.session_id, snapshot)
+            except Exception as e:
+                logger.warning("Intake session %s write-back failed: %s", self.session_id, e)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            await self._writer
+        if self._latest is not None:
+            await self._write_back()
@@ -0,0 +1,337 @@
+# app/services/job_queue.py
+"""
+Mongo-backed background job queue.
+
+``submit()`` stores a job in the ``jobs`` collection and returns its id right
+away; ``JOB_MAX_CONCURRENCY`` asyncio workers per process claim queued jobs
+with ``find_one_and_update`` (so several app processes can share the queue),
+run the registered handler under ``JOB_TIMEOUT_SECONDS`` and persist the
+result, status and a timing breakdown. Failed attempts are re-queued with
+jittered exponential backoff up to ``JOB_MAX_ATTEMPTS``. A claimed job holds
+a lease; if its process dies the lease expires and another worker picks it up
+(counted as an attempt; once ``max_attempts`` are used up the job is failed
+instead). On a clean shutdown a process hands its running jobs back to the
+queue straight away.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+
+from app import metrics
+from app.config import (
+    JOB_MAX_CONCURRENCY,
+    JOB_MAX_ATTEMPTS,
+    JOB_TIMEOUT_SECONDS,
+    JOB_RETRY_BASE_SECONDS,
+    JOB_POLL_INTERVAL_SECONDS,
+    SOAP_BATCH_TIMEOUT_SECONDS,
+)
+from app.db import get_database
+
+logger = logging.getLogger(__name__)
+
+# handler(params, stages) -> JSON-able result; record per-stage ms into ``stages``
+Handler = Callable[[Dict[str, Any], Dict[str, float]], Awaitable[Any]]
+
+_HANDLERS: Dict[str, Handler] = {}
+_TIMEOUTS: Dict[str, float] = {}
+
+
+class JobFailed(Exception):
+    """Raised by handlers to fail an attempt with a structured error."""
+
+    def __init__(self, error: Any, retryable: bool = True):
+        super().__init__(str(error))
+        self.error = error
+        self.retryable = retryable
+
+
+def register(job_type: str, timeout_seconds: float = JOB_TIMEOUT_SECONDS):
+    def deco(fn: Handler) -> Handler:
+        _HANDLERS[job_type] = fn
+        _TIMEOUTS[job_type] = timeout_seconds
+        return fn
+    return deco
+
+
+def _col(db=None):
+    return (db if db is not None else get_database()).jobs
+
+
+def ensure_indexes(db) -> None:
+    _col(db).create_index([("status", 1), ("not_before", 1)], name="job_claim")
+
+
+# ---------- Submit / inspect ----------
+
+def submit(job_type: str, params: Dict[str, Any], max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+    if job_type not in _HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    now = datetime.utcnow()
+    job_id = str(uuid4())
+    _col().insert_one({
+        "_id": job_id,
+        "type": job_type,
+        "params": params,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "created_at": now,
+        "not_before": now,
+        "result": None,
+        "error": None,
+        "timings": {"attempts": []},
+    })
+    metrics.incr(f"jobs.{job_type}.submitted")
+    if _runner is not None:
+        _runner.wake()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _col().find_one({"_id": job_id}, {"lease_until": 0})
+    if job:
+        job["job_id"] = job.pop("_id")
+    return job
+
+
+# ---------- Worker pool ----------
+
+def _backoff_seconds(attempt: int) -> float:
+    base = JOB_RETRY_BASE_SECONDS * (2 ** (attempt - 1))
+    return base + random.uniform(0, base)
+
+
+class JobRunner:
+    def __init__(self, concurrency: int = JOB_MAX_CONCURRENCY):
+        self.concurrency = concurrency
+        self.worker_id = str(uuid4())[:8]
+        self._tasks: List[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    def wake(self) -> None:
+        """Nudge idle workers; safe to call from any thread (sync routes run in the threadpool)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        for i in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._worker(i), name=f"job-worker-{i}"))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        try:
+            await run_in_threadpool(self._requeue_own)
+        except Exception:
+            logger.exception("Could not re-queue running jobs on shutdown; they will be reclaimed when their lease expires")
+
+    def _requeue_own(self) -> None:
+        """Hand jobs cancelled by shutdown back to the queue; the interrupted attempt doesn't count."""
+        res = _col().update_many(
+            {"status": "running", "worker": self.worker_id},
+            {
+                "$set": {"status": "queued", "not_before": datetime.utcnow()},
+                "$unset": {"lease_until": ""},
+                "$inc": {"attempts": -1},
+            },
+        )
+        if res.modified_count:
+            metrics.incr("jobs.requeued_on_shutdown", res.modified_count)
+            logger.info("Re-queued %d running job(s) on shutdown", res.modified_count)
+
+    def _fail_exhausted_leases(self, now: datetime) -> None:
+        """Expired leases whose job has no attempts left (it keeps killing its process) are failed."""
+        res = _col().update_many(
+            {
+                "status": "running",
+                "lease_until": {"$lt": now},
+                "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+            },
+            {
+                "$set": {"status": "failed", "error": "worker lost the job (lease expired)", "finished_at": now},
+                "$unset": {"lease_until": ""},
+            },
+        )
+        if res.modified_count:
+            metrics.incr("jobs.lease_exhausted", res.modified_count)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        self._fail_exhausted_leases(now)
+        job = _col().find_one_and_update(
+            {"$or": [
+                {"status": "queued", "not_before": {"$lte": now}},
+                # owner died; retried only while attempts remain
+                {
+                    "status": "running",
+                    "lease_until": {"$lt": now},
+                    "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+                },
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now,
+                    "worker": self.worker_id,
+                    "lease_until": now + timedelta(seconds=JOB_TIMEOUT_SECONDS + 60),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job and _TIMEOUTS.get(job["type"], JOB_TIMEOUT_SECONDS) > JOB_TIMEOUT_SECONDS:
+            # Long-running job types hold a correspondingly longer lease
+            lease = now + timedelta(seconds=_TIMEOUTS[job["type"]] + 60)
+            _col().update_one({"_id": job["_id"], "worker": self.worker_id}, {"$set": {"lease_until": lease}})
+        return job
+
+    async def _worker(self, idx: int) -> None:
+        while not self._stopping:
+            try:
+                job = await run_in_threadpool(self._claim)
+            except Exception:
+                logger.exception("Job claim failed")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_type = job["type"]
+        handler = _HANDLERS.get(job_type)
+        timeout = _TIMEOUTS.get(job_type, JOB_TIMEOUT_SECONDS)
+        started = datetime.utcnow()
+        stages: Dict[str, float] = {}
+        t0 = time.perf_counter()
+        error: Any = None
+        retryable = True
+        result: Any = None
+        try:
+            if handler is None:
+                raise JobFailed(f"No handler for job type {job_type}")
+            result = await asyncio.wait_for(handler(job["params"], stages), timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {timeout:.0f}s"
+        except JobFailed as e:
+            error = e.error
+            retryable = e.retryable
+        except Exception as e:
+            logger.exception("Job %s (%s) crashed", job["_id"], job_type)
+            error = str(e)
+        run_ms = (time.perf_counter() - t0) * 1000
+
+        attempt = {"attempt": job["attempts"], "started_at": started, "run_ms": run_ms, "stages": stages}
+        now = datetime.utcnow()
+        update: Dict[str, Any] = {"$push": {"timings.attempts": attempt}, "$unset": {"lease_until": ""}}
+        if error is None:
+            update["$set"] = {
+                "status": "succeeded",
+                "result": result,
+                "error": None,
+                "finished_at": now,
+                "timings.queue_ms": (job["started_at"] - job["created_at"]).total_seconds() * 1000,
+                "timings.run_ms": run_ms,
+                "timings.total_ms": (now - job["created_at"]).total_seconds() * 1000,
+            }
+            metrics.incr(f"jobs.{job_type}.succeeded")
+            metrics.observe(f"jobs.{job_type}.run_ms", run_ms)
+        elif retryable and job["attempts"] < job["max_attempts"]:
+            attempt["error"] = error
+            update["$set"] = {
+                "status": "queued",
+                "error": error,
+                "not_before": now + timedelta(seconds=_backoff_seconds(job["attempts"])),
+            }
+            metrics.incr(f"jobs.{job_type}.retried")
+        else:
+            attempt["error"] = error
+            update["$set"] = {
+                "status": "failed",
+                "error": error,
+                "finished_at": now,
+                "timings.total_ms": (now - job["created_at"]).total_seconds() * 1000,
+            }
+            metrics.incr(f"jobs.{job_type}.failed")
+
+        # Only the current lease holder may record the outcome
+        await run_in_threadpool(
+            _col().update_one, {"_id": job["_id"], "worker": self.worker_id, "status": "running"}, update
+        )
+
+
+_runner: Optional[JobRunner] = None
+
+
+def start_job_workers() -> None:
+    global _runner
+    if _runner is None:
+        _runner = JobRunner()
+        _runner.start()
+
+
+async def stop_job_workers() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.stop()
+        _runner = None
+
+
+# ---------- Handlers ----------
+
+@register("transcribe")
+async def _transcribe_job(params: Dict[str, Any], stages: Dict[str, float]) -> Any:
+    from app.services import audio_orchestrator
+
+    result = await audio_orchestrator.transcribe_audio_from_url(
+        params["patient_id"], params["audio_url"], timings=stages
+    )
+    if "error" in result:
+        raise JobFailed(result, retryable=result["error"] != "Audio file too large")
+    return result
+
+
+@register("soap")
+async def _soap_job(params: Dict[str, Any], stages: Dict[str, float]) -> Any:
+    from app.services import soap_orchestrator
+
+    result = await soap_orchestrator.generate_soap_summary(
+        params["patient_id"], timings=stages, force=params.get("force", False)
+    )
+    if "error" in result:
+        # The only error returned (not raised) is a missing transcript; retrying won't help
+        raise JobFailed(result, retryable=False)
+    return result
+
+
+@register("soap_batch", timeout_seconds=SOAP_BATCH_TIMEOUT_SECONDS)
+async def _soap_batch_job(params: Dict[str, Any], stages: Dict[str, float]) -> Any:
+    from app.services import soap_batch
+
+    # Checkpointed under the job's run_id, so a retried attempt picks up after the
+    # last completed page instead of restarting
+    try:
+        return await soap_batch.run_batch(
+            restart=params.get("restart", False), run_id=params.get("run_id"), stages=stages
+        )
+    except soap_batch.BatchAlreadyRunning as e:
+        raise JobFailed(str(e), retryable=False)
@@ -0,0 +1,326 @@
+# app/services/llm_gateway.py
+"""
+Single entry point for every OpenAI call in the app.
+
+- Connection reuse: calls ride on the shared clients from ``app.clients``.
+- Rate limits: one requests-per-minute and one tokens-per-minute bucket per
+  model (``LLM_RATE_LIMITS``). A call reserves its estimated tokens up front
+  and waits for the bucket to refill if it's over budget, so bursts queue
+  instead of being rejected by the API. Actual usage is reconciled after the
+  response.
+- Concurrency: at most ``LLM_MAX_CONCURRENCY`` calls in flight per process.
+- Retries: 429, 5xx and connection errors are retried with jittered
+  exponential backoff (honouring ``Retry-After``); a 429 also drains the
+  model's bucket so every other caller slows down with it.
+- Accounting: per-model call counts, queue/latency timings and prompt/
+  completion tokens in ``app.metrics`` (``llm.<model>.*``).
+
+Async callers use ``chat``, ``chat_stream`` and ``transcribe``; the few
+blocking helpers use ``chat_sync``.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+from app import metrics
+from app.clients import get_openai_client, get_sync_openai_client
+from app.config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_SECONDS,
+    LLM_RETRY_MAX_SECONDS,
+    LLM_RATE_LIMITS,
+    LLM_DEFAULT_RPM,
+    LLM_DEFAULT_TPM,
+    LLM_DEFAULT_COMPLETION_TOKENS,
+)
+from app.services.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Rate limiting ----------
+
+class _Bucket:
+    """
+    Token bucket refilled continuously at ``per_minute / 60`` per second.
+    ``reserve`` always succeeds and returns how long the caller must wait:
+    the level may go negative, which queues later callers behind it.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self.lock:
+            self._refill()
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """Correct a reservation once the real amount is known (positive = used more)."""
+        with self.lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - delta)
+
+    def drain(self, seconds: float) -> None:
+        """Make the next ``seconds`` worth of budget unavailable (after a 429)."""
+        with self.lock:
+            self._refill()
+            self.level = min(self.level, -seconds * self.rate)
+
+
+class _ModelLimits:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _Bucket(rpm) if rpm > 0 else None
+        self.tokens = _Bucket(tpm) if tpm > 0 else None
+
+    def reserve(self, tokens: int) -> float:
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def reconcile(self, estimated: int, actual: Optional[int]) -> None:
+        if self.tokens and actual is not None:
+            self.tokens.adjust(actual - estimated)
+
+    def drain(self, seconds: float) -> None:
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.drain(seconds)
+
+
+def _parse_limits(spec: str) -> Dict[str, tuple]:
+    limits = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        try:
+            model, values = item.split("=", 1)
+            rpm, tpm = values.split(":", 1)
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            logger.warning("Ignoring malformed LLM_RATE_LIMITS entry: %r", item)
+    return limits
+
+
+_CONFIGURED_LIMITS = _parse_limits(LLM_RATE_LIMITS)
+_limits: Dict[str, _ModelLimits] = {}
+_limits_lock = threading.Lock()
+
+
+def _limits_for(model: str) -> _ModelLimits:
+    with _limits_lock:
+        if model not in _limits:
+            rpm, tpm = _CONFIGURED_LIMITS.get(model, (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM))
+            _limits[model] = _ModelLimits(rpm, tpm)
+        return _limits[model]
+
+
+_async_slots: Optional[asyncio.Semaphore] = None
+_sync_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+def _slots() -> asyncio.Semaphore:
+    global _async_slots
+    if _async_slots is None:
+        _async_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _async_slots
+
+
+# ---------- Helpers ----------
+
+def estimate_tokens(model: str, messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Prompt tokens (text parts only) plus the completion budget."""
+    prompt = 0
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str):
+            prompt += count_tokens(content, model)
+        elif isinstance(content, list):
+            prompt += sum(count_tokens(p.get("text", ""), model) for p in content if isinstance(p, dict))
+        prompt += 4  # per-message framing
+    return prompt + (max_tokens or LLM_DEFAULT_COMPLETION_TOKENS)
+
+
+def _retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying ``exc``, or None if it isn't retryable."""
+    if isinstance(exc, APIStatusError):
+        if not (isinstance(exc, RateLimitError) or exc.status_code >= 500):
+            return None
+        headers = exc.response.headers
+        # Honor the server's hint, but never sleep (or drain the bucket) past our own cap
+        try:
+            if "retry-after-ms" in headers:
+                return max(0.0, min(float(headers["retry-after-ms"]) / 1000, LLM_RETRY_MAX_SECONDS))
+            if "retry-after" in headers:
+                return max(0.0, min(float(headers["retry-after"]), LLM_RETRY_MAX_SECONDS))
+        except ValueError:
+            pass
+    elif not isinstance(exc, APIConnectionError):
+        return None
+    base = min(LLM_RETRY_BASE_SECONDS * (2 ** attempt), LLM_RETRY_MAX_SECONDS)
+    return base + random.uniform(0, base)
+
+
+def _on_error(model: str, limits: _ModelLimits, exc: Exception, attempt: int) -> Optional[float]:
+    delay = _retry_delay(exc, attempt)
+    if delay is None or attempt >= LLM_MAX_RETRIES:
+        metrics.incr(f"llm.{model}.errors")
+        return None
+    metrics.incr(f"llm.{model}.retries")
+    if isinstance(exc, RateLimitError):
+        metrics.incr(f"llm.{model}.rate_limited")
+        limits.drain(delay)
+    logger.info("LLM %s attempt %d failed (%s); retrying in %.1fs", model, attempt + 1, exc, delay)
+    return delay
+
+
+def _account(model: str, limits: _ModelLimits, estimated: int, usage, queue_ms: float, latency_ms: float) -> None:
+    metrics.incr(f"llm.{model}.calls")
+    metrics.observe(f"llm.{model}.queue_ms", queue_ms)
+    metrics.observe(f"llm.{model}.latency_ms", latency_ms)
+    if usage is not None:
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        metrics.incr(f"llm.{model}.prompt_tokens", prompt)
+        metrics.incr(f"llm.{model}.completion_tokens", completion)
+        limits.reconcile(estimated, prompt + completion)
+
+
+def _rewind(kwargs: Dict[str, Any]) -> None:
+    """Retries re-send the upload, so put file objects back at the start."""
+    file = kwargs.get("file")
+    f = file[1] if isinstance(file, tuple) else file
+    if hasattr(f, "seek"):
+        f.seek(0)
+
+
+# ---------- Async API ----------
+
+async def _acquire(model: str, limits: _ModelLimits, estimated: int) -> float:
+    t0 = time.perf_counter()
+    wait = limits.reserve(estimated)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    await _slots().acquire()
+    metrics.add_gauge("llm.in_flight", 1)
+    return (time.perf_counter() - t0) * 1000
+
+
+def _release() -> None:
+    metrics.add_gauge("llm.in_flight", -1)
+    _slots().release()
+
+
+async def _call(model: str, estimated: int, make_call):
+    limits = _limits_for(model)
+    queue_ms = await _acquire(model, limits, estimated)
+    try:
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                res = await make_call()
+            except Exception as e:
+                delay = _on_error(model, limits, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            _account(model, limits, estimated, getattr(res, "usage", None), queue_ms, (time.perf_counter() - t0) * 1000)
+            return res
+    finally:
+        _release()
+
+
+async def chat(model: str, messages: List[Dict[str, Any]], **kwargs):
+    """``chat.completions.create`` with rate limiting, retries and accounting."""
+    estimated = estimate_tokens(model, messages, kwargs.get("max_tokens"))
+    return await _call(
+        model, estimated,
+        lambda: get_openai_client().chat.completions.create(model=model, messages=messages, **kwargs),
+    )
+
+
+async def chat_stream(model: str, messages: List[Dict[str, Any]], **kwargs) -> AsyncIterator[Any]:
+    """
+    Streaming ``chat.completions.create``; yields chunks. Only opening the
+    stream is retried; the concurrency slot is held until the stream ends.
+    """
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    estimated = estimate_tokens(model, messages, kwargs.get("max_tokens"))
+    limits = _limits_for(model)
+    queue_ms = await _acquire(model, limits, estimated)
+    try:
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                stream = await get_openai_client().chat.completions.create(
+                    model=model, messages=messages, stream=True, **kwargs
+                )
+                break
+            except Exception as e:
+                delay = _on_error(model, limits, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            yield chunk
+        _account(model, limits, estimated, usage, queue_ms, (time.perf_counter() - t0) * 1000)
+    finally:
+        _release()
+
+
+async def transcribe(model: str, **kwargs):
+    """``audio.transcriptions.create``; counted against the model's request budget only."""
+    async def make_call():
+        _rewind(kwargs)
+        return await get_openai_client().audio.transcriptions.create(model=model, **kwargs)
+    return await _call(model, 0, make_call)
+
+
+# ---------- Sync API (blocking helpers outside the event loop) ----------
+
+def chat_sync(model: str, messages: List[Dict[str, Any]], **kwargs):
+    estimated = estimate_tokens(model, messages, kwargs.get("max_tokens"))
+    limits = _limits_for(model)
+    t0 = time.perf_counter()
+    wait = limits.reserve(estimated)
+    if wait > 0:
+        time.sleep(wait)
+    with _sync_slots:
+        queue_ms = (time.perf_counter() - t0) * 1000
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                res = get_sync_openai_client().chat.completions.create(model=model, messages=messages, **kwargs)
+            except Exception as e:
+                delay = _on_error(model, limits, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            _account(model, limits, estimated, res.usage, queue_ms, (time.perf_counter() - t0) * 1000)
+            return res
@@ -0,0 +1,230 @@
+# app/services/session_store.py
+"""
+Storage for intake sessions.
+
+``SessionStore`` is the interface the intake orchestrator talks to. Two
+backends are provided:
+
+- ``InMemorySessionStore``: per-process LRU with TTL. Bounded memory, but
+  only correct with a single worker (or sticky routing).
+- ``MongoSessionStore``: ``intake_sessions`` collection with a TTL index on
+  ``created_at``, shared by every worker. Turn updates are written behind:
+  they are buffered and flushed in batches by a background thread every
+  ``SESSION_FLUSH_INTERVAL_MS`` (or as soon as ``SESSION_FLUSH_BATCH_SIZE``
+  sessions are pending), so a request never waits on the session write.
+  New sessions are written through, so the first follow-up request can land
+  on any worker.
+
+Pick the backend with ``SESSION_BACKEND=memory|mongo``.
+"""
+import copy
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from pymongo import ReplaceOne
+
+from app import metrics
+from app.config import (
+    SESSION_BACKEND,
+    SESSION_TTL_SECONDS,
+    SESSION_MAX_ENTRIES,
+    SESSION_FLUSH_INTERVAL_MS,
+    SESSION_FLUSH_BATCH_SIZE,
+)
+from app.db import get_database
+from app.services.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the session, or None if unknown/expired."""
+
+    @abstractmethod
+    def put(self, session_id: str, session: Dict[str, Any], durable: bool = False) -> None:
+        """Save the session. ``durable`` asks for the write to land before returning."""
+
+    @abstractmethod
+    def put_if_match(self, session_id: str, session: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+        """
+        Save the session only if the stored copy still has the ``expected``
+        top-level values (compare-and-swap); returns whether it was saved.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    def flush(self) -> None:
+        """Push any buffered writes to the backend."""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self._cache = TTLCache(max_entries, ttl_seconds, name="intake_sessions")
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        s = self._cache.get(session_id)
+        return copy.deepcopy(s) if s is not None else None
+
+    def put(self, session_id: str, session: Dict[str, Any], durable: bool = False) -> None:
+        snapshot = copy.deepcopy(session)
+        with self._lock:
+            self._cache.set(session_id, snapshot)
+
+    def put_if_match(self, session_id: str, session: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+        snapshot = copy.deepcopy(session)
+        with self._lock:
+            current = self._cache.get(session_id)
+            if current is None or any(current.get(k) != v for k, v in expected.items()):
+                return False
+            self._cache.set(session_id, snapshot)
+        return True
+
+    def delete(self, session_id: str) -> None:
+        self._cache.pop(session_id)
+
+
+class MongoSessionStore(SessionStore):
+    def __init__(
+        self,
+        db=None,
+        ttl_seconds: int = SESSION_TTL_SECONDS,
+        flush_interval_ms: int = SESSION_FLUSH_INTERVAL_MS,
+        batch_size: int = SESSION_FLUSH_BATCH_SIZE,
+    ):
+        self._db = db
+        self._ttl_seconds = ttl_seconds
+        self._interval = flush_interval_ms / 1000.0
+        self._batch_size = batch_size
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._indexed = False
+
+    def _col(self):
+        db = self._db if self._db is not None else get_database()
+        col = db.intake_sessions
+        if not self._indexed:
+            col.create_index("created_at", expireAfterSeconds=self._ttl_seconds, name="session_ttl")
+            self._indexed = True
+        return col
+
+    def _ensure_flusher(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="session-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Session write-behind flush failed; will retry")
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pending = self._pending.get(session_id)
+        if pending is not None:
+            return copy.deepcopy(pending)
+        doc = self._col().find_one({"_id": session_id})
+        if doc is None:
+            return None
+        doc.pop("_id", None)
+        return doc
+
+    def put(self, session_id: str, session: Dict[str, Any], durable: bool = False) -> None:
+        snapshot = copy.deepcopy(session)
+        if durable:
+            with self._lock:
+                self._pending.pop(session_id, None)
+            self._col().replace_one({"_id": session_id}, snapshot, upsert=True)
+            return
+        with self._lock:
+            self._pending[session_id] = snapshot
+            full = len(self._pending) >= self._batch_size
+        metrics.set_gauge("intake_sessions.pending", len(self._pending))
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+
+    def put_if_match(self, session_id: str, session: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+        """
+        Checked against the buffered copy when there is one (this worker wrote
+        last), otherwise a conditional ``replace_one`` on the stored document.
+        """
+        snapshot = copy.deepcopy(session)
+        with self._lock:
+            pending = self._pending.get(session_id)
+            if pending is not None:
+                if any(pending.get(k) != v for k, v in expected.items()):
+                    return False
+                self._pending[session_id] = snapshot
+        if pending is not None:
+            self._ensure_flusher()
+            return True
+        res = self._col().replace_one({"_id": session_id, **expected}, snapshot)
+        return res.matched_count > 0
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._pending.pop(session_id, None)
+        self._col().delete_one({"_id": session_id})
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self._col().bulk_write(
+                    [ReplaceOne({"_id": sid}, s, upsert=True) for sid, s in batch.items()],
+                    ordered=False,
+                )
+            except Exception:
+                # Put back whatever wasn't superseded meanwhile, then surface.
+                with self._lock:
+                    for sid, s in batch.items():
+                        self._pending.setdefault(sid, s)
+                raise
+            metrics.incr("intake_sessions.flushed", len(batch))
+            metrics.incr("intake_sessions.flush_batches")
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = MongoSessionStore() if SESSION_BACKEND == "mongo" else InMemorySessionStore()
+    return _store
+
+
+def close_session_store() -> None:
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
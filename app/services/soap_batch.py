@@ -0,0 +1,200 @@
+# app/services/soap_batch.py
+"""
+End-of-day SOAP generation for every visit that has a ``transcript`` but no
+``soap_summary``.
+
+Pending visits are read from the ``visits`` collection a page at a time with
+a keyset cursor (``_id > last_id``, sorted by ``_id``, projected down to what
+the prompt needs; no server cursor is held open across the slow LLM calls).
+Each page fans out to ``SOAP_BATCH_CONCURRENCY`` concurrent LLM calls, and
+the resulting notes are written back with a single unordered ``bulk_write``.
+After every page the last ``_id`` and running counters are checkpointed in
+``batch_runs``, so an interrupted run resumes where it stopped.
+
+The checkpoint document doubles as a lock: a run claims it with a lease
+(``SOAP_BATCH_LEASE_SECONDS``, renewed at every checkpoint) and only the
+owner may write it, so two runs never interleave their progress; a second
+run started meanwhile fails with BatchAlreadyRunning. ``run_id`` ties a run
+to the job that started it: a retried attempt of the same job resumes even
+when the job asked for ``restart``.
+
+Rate limits are handled by ``llm_gateway``: calls queue on the per-model
+RPM/TPM buckets and 429s are retried with backoff, so a large backlog slows
+down to the account's limits instead of failing.
+
+Visits still embedded in legacy patient documents are not picked up; run
+``python -m app.migrations.split_visits`` first.
+
+    python -m app.services.soap_batch [--page-size 50] [--concurrency 4] [--restart]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+from app import metrics
+from app.config import (
+    SOAP_BATCH_CONCURRENCY,
+    SOAP_BATCH_PAGE_SIZE,
+    SOAP_BATCH_LEASE_SECONDS,
+)
+from app.db import get_database
+from app.models import repo_cache
+from app.models import visit as visit_repo
+from app.services import soap_orchestrator
+
+logger = logging.getLogger(__name__)
+
+RUN_ID = "soap_batch"
+
+
+class BatchAlreadyRunning(RuntimeError):
+    """Another process holds the batch checkpoint's lease."""
+
+# Missing, null or empty-string transcript never qualifies; soap_summary null also matches "missing"
+_PENDING = {"transcript": {"$nin": [None, ""]}, "soap_summary": None}
+_PROJECTION = {"patient_id": 1, "visit_id": 1, "transcript": 1}
+
+
+async def _summarize_visit(visit: Dict[str, Any], sem: asyncio.Semaphore) -> Optional[UpdateOne]:
+    transcript = visit["transcript"]
+    async with sem:
+        try:
+            soap, usage = await soap_orchestrator.summarize_transcript(transcript)
+        except Exception as e:
+            logger.warning("SOAP batch: %s/%s failed: %s", visit["patient_id"], visit["visit_id"], e)
+            return None
+    meta = soap_orchestrator.build_soap_meta(soap_orchestrator.soap_digest(transcript), usage)
+    return visit_repo.soap_summary_update(visit["_id"], soap, meta)
+
+
+def _lease() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=SOAP_BATCH_LEASE_SECONDS)
+
+
+def _claim_state(db, owner: str, restart: bool, run_id: Optional[str]) -> Dict[str, Any]:
+    """Take the checkpoint's lease and return the state to continue from."""
+    try:
+        state = db.batch_runs.find_one_and_update(
+            {"_id": RUN_ID, "$or": [{"owner": None}, {"lease_until": {"$lt": datetime.utcnow()}}]},
+            {"$set": {"owner": owner, "lease_until": _lease()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        raise BatchAlreadyRunning("a SOAP batch run is already in progress")
+    if run_id is not None and state.get("run_id") == run_id:
+        return state  # retry of the same job: resume (or report its finished run)
+    if restart or "last_id" not in state or state.get("finished_at"):
+        state = {
+            "_id": RUN_ID,
+            "owner": owner,
+            "lease_until": state["lease_until"],
+            "last_id": None,
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "started_at": datetime.utcnow(),
+        }
+    state["run_id"] = run_id
+    return state
+
+
+def _save_state(db, state: Dict[str, Any], owner: str) -> None:
+    state["updated_at"] = datetime.utcnow()
+    if state.get("owner") is not None:
+        state["lease_until"] = _lease()
+    res = db.batch_runs.replace_one({"_id": RUN_ID, "owner": owner}, state)
+    if not res.matched_count:
+        raise BatchAlreadyRunning("lost the SOAP batch lease to another run")
+
+
+def _release(db, owner: str) -> None:
+    db.batch_runs.update_one({"_id": RUN_ID, "owner": owner}, {"$set": {"owner": None, "lease_until": None}})
+
+
+async def _process_page(db, page: List[Dict[str, Any]], sem: asyncio.Semaphore, state, owner: str) -> None:
+    ops = await asyncio.gather(*[_summarize_visit(v, sem) for v in page])
+    done = [op for op in ops if op is not None]
+    if done:
+        await run_in_threadpool(db.visits.bulk_write, done, ordered=False)
+        for patient_id in {v["patient_id"] for v in page}:
+            repo_cache.invalidate(db, patient_id)
+    state["processed"] += len(page)
+    state["succeeded"] += len(done)
+    state["failed"] += len(page) - len(done)
+    state["last_id"] = page[-1]["_id"]
+    await run_in_threadpool(_save_state, db, state, owner)
+    metrics.incr("soap_batch.succeeded", len(done))
+    metrics.incr("soap_batch.failed", len(page) - len(done))
+    logger.info(
+        "SOAP batch: %d processed (%d ok, %d failed)", state["processed"], state["succeeded"], state["failed"]
+    )
+
+
+async def run_batch(
+    db=None,
+    page_size: int = SOAP_BATCH_PAGE_SIZE,
+    concurrency: int = SOAP_BATCH_CONCURRENCY,
+    restart: bool = False,
+    stages: Optional[Dict[str, float]] = None,
+    run_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Summarize every pending visit; returns the run counters. Resumes from the
+    saved checkpoint unless the previous run finished or ``restart`` is set
+    (a checkpoint written under the same ``run_id`` is always resumed).
+    Visits that fail are skipped for the rest of the run and retried by the
+    next one. Raises BatchAlreadyRunning if another run holds the lease.
+    """
+    db = db if db is not None else get_database()
+    t0 = time.perf_counter()
+    owner = uuid4().hex[:12]
+    state = await run_in_threadpool(_claim_state, db, owner, restart, run_id)
+    try:
+        if not state.get("finished_at"):
+            sem = asyncio.Semaphore(concurrency)
+            while True:
+                query = dict(_PENDING)
+                if state["last_id"] is not None:
+                    query["_id"] = {"$gt": state["last_id"]}
+                page = await run_in_threadpool(
+                    lambda: list(db.visits.find(query, _PROJECTION).sort("_id", 1).limit(page_size))
+                )
+                if not page:
+                    break
+                await _process_page(db, page, sem, state, owner)
+
+            state["finished_at"] = datetime.utcnow()
+        state["owner"] = state["lease_until"] = None
+        await run_in_threadpool(_save_state, db, state, owner)
+    finally:
+        await run_in_threadpool(_release, db, owner)
+    if stages is not None:
+        stages["batch_ms"] = (time.perf_counter() - t0) * 1000
+    for key in ("_id", "owner", "lease_until"):
+        state.pop(key, None)
+    state["last_id"] = str(state["last_id"]) if state["last_id"] is not None else None
+    return state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate SOAP notes for every visit that is missing one.")
+    parser.add_argument("--page-size", type=int, default=SOAP_BATCH_PAGE_SIZE)
+    parser.add_argument("--concurrency", type=int, default=SOAP_BATCH_CONCURRENCY)
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    state = asyncio.run(run_batch(page_size=args.page_size, concurrency=args.concurrency, restart=args.restart))
+    print(f" soap_batch done: {state['processed']} visits, {state['succeeded']} ok, {state['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,33 @@
-import os
-import openai
-from app.db import get_database
-from app.models.patient import store_soap_summary, get_note_state
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
+from starlette.concurrency import run_in_threadpool
 
+from app import metrics
+from app.config import (
+    SOAP_SINGLE_CALL_MAX_TOKENS,
+    SOAP_WINDOW_TOKENS,
+    SOAP_WINDOW_OVERLAP_TOKENS,
+    SOAP_MAP_CONCURRENCY,
+    SOAP_MAP_MODEL,
+)
+from app.db import get_database
+from app.models.patient import store_soap_summary, get_latest_visit_snapshot
+from app.services import llm_gateway
+from app.services.utils.json_stream import JsonObjectStream
+from app.services.utils.tokens import count_tokens, split_by_tokens
 
-def generate_soap_summary(patient_id: str):
-    db = get_database()
-    note_state = get_note_state(db, patient_id)
-    transcript = note_state["transcript"]
+logger = logging.getLogger(__name__)
 
-    if not transcript:
-        return {"error": "Transcript not found for this visit."}
+_SOAP_MODEL = "gpt-4"
+_SYSTEM_MESSAGE = "You're an AI that writes SOAP summaries for doctors."
 
-    prompt = f"""
+_SOAP_PROMPT = """
         You are a clinical documentation assistant trained to convert doctor-patient consultation transcripts into concise, structured SOAP notes.
 
         This summary is for **doctor use only** and will be stored in the patient's medical record. It will not be shown to the patient.
@@ -81,26 +95,257 @@ def generate_soap_summary(patient_id: str):
         {transcript}
     """
 
-    messages = [
-        {"role": "system", "content": "You're an AI that writes SOAP summaries for doctors."},
-        {"role": "user", "content": prompt}
-    ]
+# Map step for long transcripts: pull section facts out of one window
+_MAP_PROMPT = """
+You are extracting facts for a clinical SOAP note from one excerpt (part {part} of {total}) of a longer doctor-patient consultation transcript. Excerpts overlap slightly.
+
+Return strict JSON only, with a list of short factual statements per section:
+{{"subjective": [], "objective": [], "assessment": [], "plan": []}}
+
+- subjective: what the patient reports (symptoms, duration, severity, history).
+- objective: doctor's observations, exam findings, vitals, results.
+- assessment: the doctor's stated impression or diagnosis.
+- plan: medications, tests, referrals, advice, follow-up stated by the doctor.
+Only include information explicitly stated in the excerpt. Use empty lists when nothing applies.
+
+Excerpt:
+{excerpt}
+""".strip()
+
+# Reduce step: merge the per-window facts into the final note (same output contract as _SOAP_PROMPT)
+_REDUCE_PROMPT = """
+You are a clinical documentation assistant. Below are facts extracted, in order, from consecutive overlapping excerpts of one doctor-patient consultation. Some facts may be repeated because the excerpts overlap.
+
+Merge them into one concise SOAP note for doctor use only:
+- Remove duplicates, keep chronology where it matters, and do not add anything not present in the facts.
+- Use medical terms where applicable; keep sentences brief and direct.
+- Use empty strings for missing sections.
+
+Output strictly valid JSON with no extra comments, markdown, or explanation:
+{{"subjective": "<string>", "objective": "<string>", "assessment": "<string>", "plan": "<string>"}}
+
+Extracted facts (JSON, one object per excerpt):
+{facts}
+""".strip()
+
+
+# Stored next to soap_summary; changes by itself whenever the model or prompt text changes
+PROMPT_VERSION = hashlib.sha256(
+    f"{_SOAP_MODEL}\n{SOAP_MAP_MODEL}\n{_SYSTEM_MESSAGE}\n{_SOAP_PROMPT}\n{_MAP_PROMPT}\n{_REDUCE_PROMPT}".encode()
+).hexdigest()[:12]
+
+
+def soap_digest(transcript: str) -> str:
+    """Identifies a SOAP note by its inputs: transcript, model and prompt template."""
+    return hashlib.sha256(f"{PROMPT_VERSION}\n{transcript}".encode()).hexdigest()
+
+
+def _parse_soap(text_output: str) -> Dict[str, Any]:
+    # Optionally parse as dict — or just store raw if GPT returns JSON
+    try:
+        return json.loads(text_output)
+    except json.JSONDecodeError:
+        return {"raw_text": text_output}
+
+
+def _usage(u, into: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    usage = into if into is not None else {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    prompt = u.prompt_tokens if u else 0
+    completion = u.completion_tokens if u else 0
+    usage["prompt_tokens"] += prompt
+    usage["completion_tokens"] += completion
+    usage["total_tokens"] += prompt + completion
+    metrics.incr("soap.llm_calls")
+    metrics.incr("soap.tokens", prompt + completion)
+    return usage
+
+
+async def _map_window(excerpt: str, part: int, total: int, sem: asyncio.Semaphore, usage: Dict[str, int]) -> dict:
+    async with sem:
+        res = await llm_gateway.chat(
+            SOAP_MAP_MODEL,
+            messages=[
+                {"role": "system", "content": _SYSTEM_MESSAGE},
+                {"role": "user", "content": _MAP_PROMPT.format(part=part, total=total, excerpt=excerpt)},
+            ],
+            temperature=0.0,
+            response_format={"type": "json_object"},
+        )
+    _usage(res.usage, into=usage)
+    facts = _parse_soap((res.choices[0].message.content or "").strip())
+    return {k: facts.get(k, []) for k in ("subjective", "objective", "assessment", "plan")}
+
+
+async def _prepare_messages(transcript: str) -> Tuple[list, Dict[str, int]]:
+    """
+    Messages for the final SOAP call, plus token usage spent getting there.
+    Transcripts within SOAP_SINGLE_CALL_MAX_TOKENS go straight into the
+    prompt (single call). Longer ones are split into overlapping windows whose
+    section facts are extracted concurrently (map); the final call then merges
+    those facts (reduce).
+    """
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    transcript_tokens = count_tokens(transcript, _SOAP_MODEL)
+    if transcript_tokens <= SOAP_SINGLE_CALL_MAX_TOKENS:
+        return [
+            {"role": "system", "content": _SYSTEM_MESSAGE},
+            {"role": "user", "content": _SOAP_PROMPT.format(transcript=transcript)}
+        ], usage
+
+    t0 = time.perf_counter()
+    windows = split_by_tokens(transcript, SOAP_WINDOW_TOKENS, SOAP_WINDOW_OVERLAP_TOKENS, SOAP_MAP_MODEL)
+    sem = asyncio.Semaphore(SOAP_MAP_CONCURRENCY)
+    facts = await asyncio.gather(*[
+        _map_window(w, i, len(windows), sem, usage) for i, w in enumerate(windows, start=1)
+    ])
+    map_ms = (time.perf_counter() - t0) * 1000
+    metrics.observe("soap.map_ms", map_ms)
+    logger.info(
+        "SOAP map: %d transcript tokens -> %d windows in %.0f ms (%d prompt / %d completion tokens)",
+        transcript_tokens, len(windows), map_ms, usage["prompt_tokens"], usage["completion_tokens"],
+    )
+    return [
+        {"role": "system", "content": _SYSTEM_MESSAGE},
+        {"role": "user", "content": _REDUCE_PROMPT.format(facts=json.dumps(facts, ensure_ascii=False))}
+    ], usage
+
+
+async def summarize_transcript(transcript: str) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """transcript -> (soap_dict, token usage); one LLM call unless map-reduce is needed."""
+    messages, usage = await _prepare_messages(transcript)
 
-    res = openai.ChatCompletion.create(
-        model="gpt-4",
+    t0 = time.perf_counter()
+    res = await llm_gateway.chat(
+        _SOAP_MODEL,
         messages=messages,
         temperature=0.4,
         max_tokens=500
     )
+    final_ms = (time.perf_counter() - t0) * 1000
+    metrics.observe("soap.final_call_ms", final_ms)
+    logger.info(
+        "SOAP final call: %.0f ms, %d prompt / %d completion tokens",
+        final_ms, res.usage.prompt_tokens if res.usage else 0, res.usage.completion_tokens if res.usage else 0,
+    )
 
-    text_output = res.choices[0].message["content"].strip()
+    _usage(res.usage, into=usage)
+    return _parse_soap((res.choices[0].message.content or "").strip()), usage
+
+
+def build_soap_meta(digest: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "digest": digest,
+        "model": _SOAP_MODEL,
+        "prompt_version": PROMPT_VERSION,
+        "usage": usage,
+        "generated_at": datetime.utcnow(),
+    }
+
+
+# All SOAP generation reads from the visit; always uncached, since the transcript
+# may have just been written by another worker
+_VISIT_FIELDS = ("transcript", "soap_summary", "soap_meta")
+
+
+def _cached_soap(visit: Dict[str, Any], digest: str) -> Optional[Dict[str, Any]]:
+    """Stored SOAP note if it was generated from exactly these inputs."""
+    meta = visit.get("soap_meta") or {}
+    if visit.get("soap_summary") and meta.get("digest") == digest:
+        metrics.incr("soap_cache.hits")
+        metrics.incr("soap_cache.tokens_saved", (meta.get("usage") or {}).get("total_tokens", 0))
+        return visit["soap_summary"]
+    metrics.incr("soap_cache.misses")
+    return None
+
+
+async def generate_soap_summary(patient_id: str, timings: Optional[Dict[str, float]] = None, force: bool = False):
+    """
+    ``timings``, if given, receives load/llm/store durations in ms. The stored
+    summary is returned without an LLM call when the transcript, model and
+    prompt are unchanged since it was generated, unless ``force`` is set.
+    """
+    timings = timings if timings is not None else {}
+    db = get_database()
+    t0 = time.perf_counter()
+    visit = await run_in_threadpool(get_latest_visit_snapshot, db, patient_id, _VISIT_FIELDS, False) or {}
+    timings["load_ms"] = (time.perf_counter() - t0) * 1000
+    transcript = visit.get("transcript", "")
+
+    if not transcript:
+        return {"error": "Transcript not found for this visit."}
+
+    digest = soap_digest(transcript)
+    if not force:
+        cached = _cached_soap(visit, digest)
+        if cached is not None:
+            return {"soap_summary": cached, "cached": True}
+
+    t0 = time.perf_counter()
+    soap_dict, usage = await summarize_transcript(transcript)
+    timings["llm_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    await run_in_threadpool(store_soap_summary, db, patient_id, soap_dict, build_soap_meta(digest, usage))
+    timings["store_ms"] = (time.perf_counter() - t0) * 1000
+    return {"soap_summary": soap_dict, "cached": False}
+
+
+SOAP_SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+
+async def stream_soap_summary(patient_id: str, force: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of generate_soap_summary. Yields ``(event, data)``:
+    ``("section", {"name", "text"})`` as soon as each SOAP section's JSON
+    value is complete, then ``("done", {"soap_summary", "cached"})`` once the
+    note is stored, or ``("error", {...})``.
+    """
+    db = get_database()
+    visit = await run_in_threadpool(get_latest_visit_snapshot, db, patient_id, _VISIT_FIELDS, False) or {}
+    transcript = visit.get("transcript", "")
+    if not transcript:
+        yield "error", {"error": "Transcript not found for this visit."}
+        return
+
+    digest = soap_digest(transcript)
+    cached = None if force else _cached_soap(visit, digest)
+    if cached is not None:
+        for name in SOAP_SECTIONS:
+            if name in cached:
+                yield "section", {"name": name, "text": cached[name]}
+        yield "done", {"soap_summary": cached, "cached": True}
+        return
 
-    # Optionally parse as dict — or just store raw if GPT returns JSON
-    import json
     try:
-        soap_dict = json.loads(text_output)
-    except json.JSONDecodeError:
-        soap_dict = {"raw_text": text_output}
+        messages, usage = await _prepare_messages(transcript)
+        t0 = time.perf_counter()
+        first_section = True
+        parser = JsonObjectStream()
+        final_usage = None
+        stream = llm_gateway.chat_stream(
+            _SOAP_MODEL,
+            messages=messages,
+            temperature=0.4,
+            max_tokens=500,
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                final_usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            for name, value in parser.feed(delta):
+                if first_section:
+                    metrics.observe("soap.stream.first_section_ms", (time.perf_counter() - t0) * 1000)
+                    first_section = False
+                yield "section", {"name": name, "text": value}
 
-    store_soap_summary(db, patient_id, soap_dict)
-    return {"soap_summary": soap_dict}
+        soap_dict = _parse_soap(parser.text.strip())
+        _usage(final_usage, into=usage)
+        await run_in_threadpool(store_soap_summary, db, patient_id, soap_dict, build_soap_meta(digest, usage))
+    except Exception as e:
+        logger.exception("Streaming SOAP generation failed for patient %s", patient_id)
+        metrics.incr("soap.stream.errors")
+        yield "error", {"error": f"SOAP generation failed: {e}"}
+        return
+    yield "done", {"soap_summary": soap_dict, "cached": False}
@@ -0,0 +1,77 @@
+# app/services/transcription_cache.py
+"""
+Persistent transcript cache keyed by the SHA-256 of the audio bytes (plus
+the transcription model), stored in the ``transcription_cache`` collection
+so every worker shares it. Entries are LRU-evicted by ``last_used_at`` once
+the collection grows past ``TRANSCRIPT_CACHE_MAX_ENTRIES``.
+"""
+from datetime import datetime
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from app import metrics
+from app.config import TRANSCRIPT_CACHE_ENABLED, TRANSCRIPT_CACHE_MAX_ENTRIES
+from app.db import get_database
+
+_EVICT_EVERY = 100  # check the size bound every N inserts
+_inserts = 0
+
+
+def _col(db=None):
+    return (db if db is not None else get_database()).transcription_cache
+
+
+def ensure_indexes(db) -> None:
+    _col(db).create_index("last_used_at", name="lru")
+
+
+def cache_key(audio_sha256: str, model: str) -> str:
+    return f"{model}:{audio_sha256}"
+
+
+def get(key: str) -> Optional[str]:
+    if not TRANSCRIPT_CACHE_ENABLED:
+        return None
+    doc = _col().find_one_and_update(
+        {"_id": key},
+        {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+        projection={"transcript": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        metrics.incr("transcription_cache.misses")
+        return None
+    metrics.incr("transcription_cache.hits")
+    return doc["transcript"]
+
+
+def put(key: str, transcript: str, audio_bytes: int) -> None:
+    global _inserts
+    if not TRANSCRIPT_CACHE_ENABLED:
+        return
+    now = datetime.utcnow()
+    _col().update_one(
+        {"_id": key},
+        {
+            "$set": {"transcript": transcript, "last_used_at": now},
+            "$setOnInsert": {"created_at": now, "audio_bytes": audio_bytes, "hits": 0},
+        },
+        upsert=True,
+    )
+    _inserts += 1
+    if _inserts % _EVICT_EVERY == 0:
+        evict()
+
+
+def evict(max_entries: int = TRANSCRIPT_CACHE_MAX_ENTRIES) -> int:
+    """Drop least-recently-used entries beyond ``max_entries``; returns how many."""
+    col = _col()
+    excess = col.estimated_document_count() - max_entries
+    if excess <= 0:
+        return 0
+    ids = [d["_id"] for d in col.find({}, {"_id": 1}).sort("last_used_at", 1).limit(excess)]
+    if ids:
+        col.delete_many({"_id": {"$in": ids}})
+        metrics.incr("transcription_cache.evictions", len(ids))
+    return len(ids)
@@ -0,0 +1,19 @@
+# app/services/utils/cursor.py
+"""Opaque pagination cursors: URL-safe base64 of a small JSON object."""
+import base64
+import json
+from typing import Any, Dict
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """Raises ValueError for anything that isn't a cursor ``encode_cursor`` made."""
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("cursor is not an object")
+    return data
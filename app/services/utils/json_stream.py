@@ -0,0 +1,103 @@
+# app/services/utils/json_stream.py
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class JsonObjectStream:
+    """
+    Incremental parser for a single JSON object arriving in arbitrary text
+    chunks (e.g. streamed LLM tokens). ``feed()`` returns each top-level
+    ``(key, value)`` pair as soon as its value is complete, so callers can act
+    on a field before the whole object has arrived. Text before the opening
+    ``{`` (such as a markdown code fence) is ignored. ``partial()`` exposes
+    the decoded prefix of a top-level string value that is still arriving.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._i = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._state = "start"  # start -> key -> colon -> value -> key ... -> done
+        self._key: Optional[str] = None
+        self._key_start = 0
+        self._val_start = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def partial(self) -> Optional[Tuple[str, str]]:
+        """``(key, text so far)`` while a top-level string value is mid-stream, else None."""
+        if self._state != "value" or self._depth != 1 or not self._in_str or self._key is None:
+            return None
+        raw = self._text[self._val_start:self._i].lstrip()
+        if not raw.startswith('"'):
+            return None
+        body = raw[1:]
+        # Drop a trailing, not yet complete escape sequence (at most "\\uXXX")
+        for cut in range(0, 6):
+            candidate = body[:len(body) - cut] if cut else body
+            try:
+                return self._key, json.loads(f'"{candidate}"')
+            except json.JSONDecodeError:
+                continue
+        return self._key, ""
+
+    def _emit(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        raw = self._text[self._val_start:end].strip()
+        if self._key is not None and raw:
+            try:
+                out.append((self._key, json.loads(raw)))
+            except json.JSONDecodeError:
+                pass
+        self._key = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+        self._text += chunk
+        text = self._text
+        while self._i < len(text) and self._state != "done":
+            i, ch = self._i, text[self._i]
+            self._i += 1
+            if self._state == "start":
+                if ch == "{":
+                    self._depth = 1
+                    self._state = "key"
+                continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._state == "key":
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._state = "colon"
+                continue
+            if ch == '"':
+                self._in_str = True
+                if self._depth == 1 and self._state == "key":
+                    self._key_start = i
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._state == "value":
+                        self._emit(i, out)
+                    self._state = "done"
+            elif self._depth == 1:
+                if ch == ":" and self._state == "colon":
+                    self._state = "value"
+                    self._val_start = i + 1
+                elif ch == "," and self._state == "value":
+                    self._emit(i, out)
+                    self._state = "key"
+        return out
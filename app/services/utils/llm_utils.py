@@ -1,9 +1,5 @@
 # app/services/utils/llm_utils.py
-import os
-from openai import OpenAI
-from app.config import OPENAI_API_KEY
-
-_client = OpenAI(api_key=OPENAI_API_KEY or os.getenv("OPENAI_API_KEY", ""))
+from app.services import llm_gateway
 
 def generate_soap_from_transcript(structured_transcript: dict) -> str:
     prompt = (
@@ -12,8 +8,8 @@ def generate_soap_from_transcript(structured_transcript: dict) -> str:
         'like {"raw_text": "..."}.\n\n'
         f"Transcript: {structured_transcript}"
     )
-    resp = _client.chat.completions.create(
-        model="gpt-4o-mini",
+    resp = llm_gateway.chat_sync(
+        "gpt-4o-mini",
         temperature=0.3,
         messages=[{"role": "user", "content": prompt}],
     )
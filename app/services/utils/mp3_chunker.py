@@ -0,0 +1,194 @@
+# app/services/utils/mp3_chunker.py
+"""
+Pure-Python MPEG audio (MP1/2/3) frame scanner used to cut long recordings
+into overlapping segments on frame boundaries, plus the text stitching that
+undoes the overlap after transcription. No decoding, no external binaries:
+only frame headers are read, so memory stays flat regardless of file length.
+"""
+import re
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+# kbps, indexed by [version_key][layer][bitrate_index]; version_key 1 = MPEG1, 2 = MPEG2/2.5
+_BITRATES = {
+    1: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    2: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+# Hz, indexed by version bits (0 = MPEG2.5, 2 = MPEG2, 3 = MPEG1)
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+_LAYERS = {3: 1, 2: 2, 1: 3}  # layer bits -> layer number
+
+_RESYNC_LIMIT = 64 * 1024  # give up if no frame header within this many bytes
+
+
+class Frame(NamedTuple):
+    offset: int
+    length: int
+    duration: float  # seconds
+
+
+class Segment(NamedTuple):
+    start: int       # byte offset (inclusive)
+    end: int         # byte offset (exclusive)
+    start_time: float
+    end_time: float
+
+
+def _parse_header(h: bytes) -> Optional[tuple]:
+    """Return (frame_length, duration_seconds) for a 4-byte header, or None."""
+    if len(h) < 4 or h[0] != 0xFF or (h[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (h[1] >> 3) & 0x03
+    layer_bits = (h[1] >> 1) & 0x03
+    bitrate_index = (h[2] >> 4) & 0x0F
+    sr_index = (h[2] >> 2) & 0x03
+    padding = (h[2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sr_index == 3:
+        return None  # reserved / free-format / bad values
+
+    layer = _LAYERS[layer_bits]
+    mpeg1 = version_bits == 3
+    bitrate = _BITRATES[1 if mpeg1 else 2][layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sr_index]
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = (samples // 8) * bitrate // sample_rate + padding
+    if length < 4:
+        return None
+    return length, samples / sample_rate
+
+
+def _id3v2_size(head: bytes) -> int:
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_frames(f: BinaryIO) -> Iterator[Frame]:
+    """
+    Yield every audio frame in ``f`` (reads headers only). Skips a leading
+    ID3v2 tag, resyncs over junk, and stops at a trailing ID3v1 tag, a
+    truncated final frame or EOF. Yields nothing if the stream doesn't look
+    like MPEG audio.
+    """
+    f.seek(0, 2)
+    file_size = f.tell()
+    f.seek(0)
+    pos = _id3v2_size(f.read(10))
+    skipped = 0
+    while True:
+        f.seek(pos)
+        header = f.read(4)
+        if len(header) < 4 or header[:3] == b"TAG":
+            return
+        parsed = _parse_header(header)
+        if parsed is None:
+            pos += 1
+            skipped += 1
+            if skipped > _RESYNC_LIMIT:
+                return
+            continue
+        length, duration = parsed
+        if pos + length > file_size:
+            return
+        yield Frame(pos, length, duration)
+        pos += length
+        skipped = 0
+
+
+def plan_segments(frames: Iterable[Frame], segment_seconds: float, overlap_seconds: float) -> List[Segment]:
+    """
+    Group consecutive frames into segments of ~``segment_seconds``, a new one
+    starting every ``segment_seconds - overlap_seconds``. Single pass over
+    ``frames`` with O(1) state, so the frame index is never materialised.
+    """
+    step = max(segment_seconds - overlap_seconds, 1.0)
+    segments: List[Segment] = []
+    open_segs: List[tuple] = []  # (start_offset, start_time, window_end)
+    next_start = 0.0
+    t = 0.0
+    end = 0
+    for fr in frames:
+        while open_segs and t >= open_segs[0][2]:
+            start_offset, start_time, _ = open_segs.pop(0)
+            segments.append(Segment(start_offset, fr.offset, start_time, t))
+        if t >= next_start:
+            open_segs.append((fr.offset, t, next_start + segment_seconds))
+            next_start += step
+        t += fr.duration
+        end = fr.offset + fr.length
+    if open_segs:
+        # The earliest still-open segment already runs to the end and covers the rest
+        start_offset, start_time, _ = open_segs[0]
+        segments.append(Segment(start_offset, end, start_time, t))
+    return segments
+
+
+def read_segment(f: BinaryIO, segment: Segment) -> bytes:
+    f.seek(segment.start)
+    return f.read(segment.end - segment.start)
+
+
+# ---------- Stitching ----------
+
+def _norm(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def _longest_common_run(a: List[str], b: List[str]) -> tuple:
+    """(length, end_in_a, end_in_b) of the longest common contiguous word run."""
+    best = (0, 0, 0)
+    prev = [0] * (len(b) + 1)
+    for i in range(1, len(a) + 1):
+        cur = [0] * (len(b) + 1)
+        for j in range(1, len(b) + 1):
+            if a[i - 1] and a[i - 1] == b[j - 1]:
+                cur[j] = prev[j - 1] + 1
+                if cur[j] > best[0]:
+                    best = (cur[j], i, j)
+        prev = cur
+    return best
+
+
+def stitch_transcripts(parts: Sequence[str], max_overlap_words: int = 60, min_match_words: int = 3) -> str:
+    """
+    Join per-segment transcripts in order, removing the words repeated
+    because consecutive segments overlap. The overlap is located as the
+    longest common word run between the tail of the text so far and the head
+    of the next part; anything after it in the tail / before it in the head is
+    edge noise from cutting mid-word and is dropped too.
+    """
+    words: List[str] = []
+    for part in parts:
+        nxt = (part or "").split()
+        if not nxt:
+            continue
+        if not words:
+            words = nxt
+            continue
+        tail = words[-max_overlap_words:]
+        head = nxt[:max_overlap_words]
+        n, end_a, end_b = _longest_common_run([_norm(w) for w in tail], [_norm(w) for w in head])
+        if n >= min_match_words:
+            cut = len(words) - len(tail) + end_a
+            words = words[:cut] + nxt[end_b:]
+        else:
+            words.extend(nxt)
+    return " ".join(words)
@@ -1,9 +1,5 @@
 # app/services/utils/ocr_mistral.py
-import os
-from openai import OpenAI
-from app.config import OPENAI_API_KEY
-
-_client = OpenAI(api_key=OPENAI_API_KEY or os.getenv("OPENAI_API_KEY", ""))
+from app.services import llm_gateway
 
 def extract_prescription_text(image_url: str) -> str:
     """
@@ -13,8 +9,8 @@ def extract_prescription_text(image_url: str) -> str:
     if not image_url:
         return ""
     try:
-        resp = _client.chat.completions.create(
-            model="gpt-4o-mini",
+        resp = llm_gateway.chat_sync(
+            "gpt-4o-mini",
             temperature=0.0,
             messages=[{
                 "role": "user",
@@ -0,0 +1,58 @@
+# app/services/utils/tokens.py
+"""
+Local token counting and token-window splitting. Uses tiktoken when it is
+installed; otherwise falls back to a ~4 characters/token estimate, which is
+close enough for budgeting English clinical text.
+"""
+from functools import lru_cache
+from typing import List
+
+try:
+    import tiktoken  # type: ignore
+except ImportError:  # optional dependency
+    tiktoken = None
+
+_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text))
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def split_by_tokens(text: str, window_tokens: int, overlap_tokens: int, model: str = "gpt-4") -> List[str]:
+    """Cut ``text`` into windows of ``window_tokens`` that overlap by ``overlap_tokens``."""
+    step = max(window_tokens - overlap_tokens, 1)
+    enc = _encoding(model)
+    if enc is not None:
+        ids = enc.encode(text)
+        return [enc.decode(ids[i:i + window_tokens]) for i in range(0, max(len(ids) - overlap_tokens, 1), step)]
+
+    # Estimate on characters, snapping cuts to whitespace so words stay whole
+    window, stride = window_tokens * _CHARS_PER_TOKEN, step * _CHARS_PER_TOKEN
+    windows = []
+    start = 0
+    while start < len(text):
+        end = min(start + window, len(text))
+        if end < len(text):
+            ws = text.rfind(" ", start + stride, end)
+            end = ws if ws > start else end
+        windows.append(text[start:end])
+        if end >= len(text):
+            break
+        nxt = start + stride
+        ws = text.rfind(" ", start + 1, nxt)
+        start = ws + 1 if ws > start else nxt
+    return windows
@@ -0,0 +1,77 @@
+# app/services/utils/ttl_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire ``ttl_seconds`` after they
+    were last written. When ``name`` is given, hits/misses/evictions are
+    counted in app.metrics under ``<name>.*``, with the running hit ratio in
+    the ``<name>.hit_rate`` gauge.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    def _count(self, event: str, n: int = 1) -> None:
+        if self.name:
+            metrics.incr(f"{self.name}.{event}", n)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                value = _MISSING
+            elif entry[0] <= now:
+                del self._data[key]
+                self._count("expired")
+                value = _MISSING
+            else:
+                self._data.move_to_end(key)
+                value = entry[1]
+        self._count("misses" if value is _MISSING else "hits")
+        if self.name:
+            with self._lock:
+                self._lookups += 1
+                self._hits += value is not _MISSING
+                rate = self._hits / self._lookups
+            metrics.set_gauge(f"{self.name}.hit_rate", rate)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        evicted = 0
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
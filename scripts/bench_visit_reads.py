@@ -0,0 +1,126 @@
+# scripts/bench_visit_reads.py
+"""
+Read benchmark: "show one visit's consultation block" for patients with large
+histories.
+
+Strategies:
+  whole-doc   legacy: fetch the whole patient document (every visit's
+              transcript and SOAP note) and scan ``visits`` in Python
+  filter      legacy layout, visit_repo read with ``fields``: $filter
+              aggregation returning only that visit's consultation block
+  projected   visits collection, visit_repo read with ``fields``: one indexed
+              document, projected to the consultation block
+
+Documents are fetched as raw BSON so bytes on the wire and client-side decode
+time can be reported separately. Prints bytes per read and p50/p99 fetch (ms)
+and decode (µs) times for histories of 1, 100 and 1000 visits.
+
+    MONGO_URI=mongodb://127.0.0.1:27017 python -m scripts.bench_visit_reads
+
+Uses a throwaway database (BENCH_DB_NAME, default "clinicai_bench") that is
+dropped at the end.
+"""
+import os
+import statistics
+import time
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from app.db import get_mongo_client
+from app.models import visit as visit_repo
+from scripts.bench_visit_writes import HISTORY_SIZES, DB_NAME, _seed
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "200"))
+_RAW = CodecOptions(document_class=RawBSONDocument)
+
+
+class _RecordingDB:
+    """Wraps a raw-BSON database and records every document the repository reads."""
+
+    def __init__(self, db):
+        self._db = db
+        self.raw_docs = []
+
+    def __getattr__(self, name):
+        return _RawCollection(self._db[name], self.raw_docs)
+
+
+class _RawCollection:
+    def __init__(self, col, sink):
+        self._col = col
+        self._sink = sink
+
+    def find_one(self, *args, **kwargs):
+        doc = self._col.find_one(*args, **kwargs)
+        if doc is not None:
+            self._sink.append(doc.raw)
+        return doc
+
+    def aggregate(self, *args, **kwargs):
+        for doc in self._col.aggregate(*args, **kwargs):
+            self._sink.append(doc.raw)
+            yield doc
+
+
+def _whole_doc(db, patient_id: str, visit_id: str) -> list:
+    doc = db.clinicAi.find_one({"patient_id": patient_id})
+    return [doc.raw] if doc is not None else []
+
+
+def _repo_read(db, patient_id: str, visit_id: str) -> list:
+    recording = _RecordingDB(db)
+    # Uncached: the repo cache would otherwise answer every iteration after the first
+    visit_repo.get_visit(recording, patient_id, visit_id, fields=("consultation",), cached=False)
+    return recording.raw_docs
+
+
+def _measure(fetch, db, patient_id: str, visit_id: str) -> tuple:
+    fetch_ms, decode_us, sizes = [], [], []
+    for _ in range(ITERATIONS):
+        t0 = time.perf_counter()
+        raws = fetch(db, patient_id, visit_id)
+        fetch_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        docs = [bson.decode(r) for r in raws]
+        if fetch is _whole_doc and docs:
+            next((v for v in docs[0].get("visits", []) if v.get("visit_id") == visit_id), None)
+        decode_us.append((time.perf_counter() - t0) * 1_000_000)
+        sizes.append(sum(len(r) for r in raws))
+    return sizes[-1], fetch_ms, decode_us
+
+
+def _pct(samples: list, p: float) -> float:
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(p) - 1]
+
+
+def main() -> None:
+    client = get_mongo_client()
+    db = client[DB_NAME]
+    visit_repo.ensure_indexes(db)
+    raw_db = client.get_database(DB_NAME, codec_options=_RAW)
+    strategies = (
+        ("whole-doc", _whole_doc, True),
+        ("filter", _repo_read, True),
+        ("projected", _repo_read, False),
+    )
+    print(f"{'visits':>7} {'strategy':>10} {'bytes':>10} {'fetch p50':>10} {'fetch p99':>10} {'decode p50 µs':>14}")
+    try:
+        for n in HISTORY_SIZES:
+            for name, fetch, embedded in strategies:
+                pid = f"bench-{n}-{name}"
+                # Read a visit from the middle of the history
+                _seed(db, pid, n, embedded)
+                vid = f"V{n // 2:06d}"
+                size, fetch_ms, decode_us = _measure(fetch, raw_db, pid, vid)
+                print(
+                    f"{n:>7} {name:>10} {size:>10} {_pct(fetch_ms, 50):>10.2f} "
+                    f"{_pct(fetch_ms, 99):>10.2f} {_pct(decode_us, 50):>14.1f}"
+                )
+    finally:
+        client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
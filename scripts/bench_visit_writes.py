@@ -0,0 +1,102 @@
+# scripts/bench_visit_writes.py
+"""
+Write-latency benchmark: legacy whole-array rewrite of an embedded ``visits``
+array vs. the visit repository (one document per visit, targeted update).
+
+Seeds one patient with 1, 100 and 1000 visits (each carrying a transcript and
+a SOAP note, like production documents), then times "add a note to the latest
+visit" with both strategies and prints p50/p99 in milliseconds.
+
+    MONGO_URI=mongodb://127.0.0.1:27017 python -m scripts.bench_visit_writes
+
+Uses a throwaway database (BENCH_DB_NAME, default "clinicai_bench") that is
+dropped at the end.
+"""
+import os
+import statistics
+import time
+from datetime import datetime
+
+from app.db import get_mongo_client
+from app.models import visit as visit_repo
+
+HISTORY_SIZES = [1, 100, 1000]
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "200"))
+DB_NAME = os.getenv("BENCH_DB_NAME", "clinicai_bench")
+
+_TRANSCRIPT = "Doctor: How are you feeling today? Patient: Headache since two days. " * 40
+_SOAP = {k: "Lorem ipsum clinical text " * 10 for k in ("subjective", "objective", "assessment", "plan")}
+
+
+def _seed(db, patient_id: str, n_visits: int, embedded: bool) -> str:
+    visits = [
+        {
+            "visit_id": f"V{i:06d}",
+            "created_at": datetime.utcnow(),
+            "transcript": _TRANSCRIPT,
+            "soap_summary": _SOAP,
+            "consultation": {"status": "completed", "notes": [{"text": "note", "created_at": datetime.utcnow()}]},
+        }
+        for i in range(n_visits)
+    ]
+    db.clinicAi.delete_many({"patient_id": patient_id})
+    db.visits.delete_many({"patient_id": patient_id})
+    if embedded:
+        db.clinicAi.insert_one({"patient_id": patient_id, "patient_info": {}, "visits": visits})
+    else:
+        db.clinicAi.insert_one({"patient_id": patient_id, "patient_info": {}})
+        db.visits.insert_many([{"patient_id": patient_id, **v} for v in visits])
+    return visits[-1]["visit_id"]
+
+
+def _legacy_add_note(db, patient_id: str, visit_id: str, text: str) -> None:
+    # The pre-atomic implementation: load everything, rewrite everything.
+    patient = db.clinicAi.find_one({"patient_id": patient_id}, {"_id": 0})
+    visits = list(patient.get("visits", []))
+    for i, v in enumerate(visits):
+        if v.get("visit_id") == visit_id:
+            v = dict(v)
+            c = dict(v.get("consultation") or {})
+            c["notes"] = list(c.get("notes") or []) + [{"text": text, "created_at": datetime.utcnow()}]
+            c["status"] = "in-progress"
+            v["consultation"] = c
+            visits[i] = v
+            break
+    db.clinicAi.update_one({"patient_id": patient_id}, {"$set": {"visits": visits}})
+
+
+def _time(fn, *args) -> list:
+    samples = []
+    for i in range(ITERATIONS):
+        t0 = time.perf_counter()
+        fn(*args, f"bench note {i}")
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _pct(samples: list, p: float) -> float:
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(p) - 1]
+
+
+def main() -> None:
+    client = get_mongo_client()
+    db = client[DB_NAME]
+    visit_repo.ensure_indexes(db)
+    strategies = (
+        ("rewrite", _legacy_add_note, True),
+        ("atomic", visit_repo.add_note, False),
+    )
+    print(f"{'visits':>7} {'strategy':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    try:
+        for n in HISTORY_SIZES:
+            for name, fn, embedded in strategies:
+                pid = f"bench-{n}-{name}"
+                vid = _seed(db, pid, n, embedded)
+                samples = _time(fn, db, pid, vid)
+                print(f"{n:>7} {name:>8} {_pct(samples, 50):>9.2f} {_pct(samples, 99):>9.2f}")
+    finally:
+        client.drop_database(DB_NAME)
+
+
+if __name__ == "__main__":
+    main()
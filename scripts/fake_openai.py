@@ -0,0 +1,42 @@
+# scripts/fake_openai.py
+"""
+Stand-in for the OpenAI API that answers chat completions after a fixed
+delay, so load tests measure our concurrency rather than the model.
+
+    FAKE_LLM_DELAY=2 uvicorn scripts.fake_openai:app --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=x uvicorn app.main:app
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI
+
+DELAY = float(os.getenv("FAKE_LLM_DELAY", "2"))
+
+app = FastAPI()
+
+_ANSWER = json.dumps({
+    "next_question": "How long have you had these symptoms?",
+    "done": False,
+    "needs_extra": False,
+    "reason": "load test",
+})
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    await asyncio.sleep(DELAY)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": _ANSWER},
+        }],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
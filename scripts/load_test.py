@@ -0,0 +1,69 @@
+# scripts/load_test.py
+"""
+Minimal closed-loop load generator: keeps ``--concurrency`` requests in
+flight until ``--requests`` have completed, then prints throughput and
+latency percentiles. Run it against a build before and after a change with
+the same fake upstream (scripts/fake_openai.py) to compare.
+
+    python -m scripts.load_test --url "http://127.0.0.1:8000/intake/next-question?session_id=..." \
+        --requests 500 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client, args, queue, latencies, errors):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        t0 = time.perf_counter()
+        try:
+            resp = await client.request(args.method, args.url, json=args.body)
+            if resp.status_code >= 400:
+                errors.append(resp.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+
+async def run(args) -> None:
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+    latencies: list = []
+    errors: list = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*[
+            _worker(client, args, queue, latencies, errors) for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - t0
+
+    q = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    print(f"requests:    {len(latencies)} ({len(errors)} errors)")
+    print(f"elapsed:     {elapsed:.2f} s")
+    print(f"throughput:  {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50: {q[49]:.0f} ms  p99: {q[98]:.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--json", dest="body", type=json.loads, default=None, help="JSON request body")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# scripts/stress_visit_notes.py
+"""
+Concurrency stress test: N threads each add M notes to the same visit, as if
+several doctors' tablets were writing at once. Checks that no acknowledged
+note is lost.
+
+Strategies:
+  naive    read the visit, append, ``$set`` it back (no version check); the
+           last writer wins and silently drops the others' notes
+  cas      ``visit_repo.mutate_visit``: the same read-modify-write, but the
+           write is a compare-and-swap on ``version`` with retry on conflict
+  atomic   ``visit_repo.add_note``: a single ``$push``, no read at all
+
+A write that ``mutate_visit`` gives up on raises ConflictError (HTTP 409 in
+the API); it is counted as rejected, not lost, since the caller was told.
+Prints acknowledged/persisted/lost/rejected notes, conflicts, throughput and
+p50/p99 latency per strategy, and exits non-zero if cas or atomic lost any.
+
+    MONGO_URI=mongodb://127.0.0.1:27017 STRESS_THREADS=8 STRESS_NOTES=50 \\
+        python -m scripts.stress_visit_notes
+
+Uses a throwaway database (BENCH_DB_NAME, default "clinicai_bench") that is
+dropped at the end.
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+from app import metrics
+from app.db import get_mongo_client
+from app.models import visit as visit_repo
+
+THREADS = int(os.getenv("STRESS_THREADS", "8"))
+NOTES_PER_THREAD = int(os.getenv("STRESS_NOTES", "50"))
+DB_NAME = os.getenv("BENCH_DB_NAME", "clinicai_bench")
+
+
+def _append_note(text: str):
+    def mutate(visit: dict) -> dict:
+        c = dict(visit.get("consultation") or {})
+        c["notes"] = list(c.get("notes") or []) + [{"text": text, "created_at": datetime.utcnow()}]
+        c["status"] = "in-progress"
+        visit["consultation"] = c
+        return visit
+    return mutate
+
+
+def _naive(db, patient_id: str, visit_id: str, text: str) -> None:
+    # mutate_visit before versioning: read, modify, blind $set
+    key = {"patient_id": patient_id, "visit_id": visit_id}
+    visit = db.visits.find_one(key, {"_id": 0})
+    new_v = _append_note(text)(visit)
+    db.visits.update_one(key, {"$set": {"consultation": new_v["consultation"]}})
+
+
+def _cas(db, patient_id: str, visit_id: str, text: str) -> None:
+    visit_repo.mutate_visit(db, patient_id, visit_id, _append_note(text))
+
+
+def _atomic(db, patient_id: str, visit_id: str, text: str) -> None:
+    visit_repo.add_note(db, patient_id, visit_id, text)
+
+
+def _run(write, db, patient_id: str, visit_id: str) -> dict:
+    acked, rejected, latencies = [], [], []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker(t: int) -> None:
+        start.wait()
+        for i in range(NOTES_PER_THREAD):
+            text = f"t{t}-n{i}"
+            t0 = time.perf_counter()
+            try:
+                write(db, patient_id, visit_id, text)
+            except visit_repo.ConflictError:
+                with lock:
+                    rejected.append(text)
+                continue
+            with lock:
+                acked.append(text)
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(THREADS)]
+    t0 = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t0
+
+    visit = db.visits.find_one({"patient_id": patient_id, "visit_id": visit_id}, {"consultation.notes": 1})
+    persisted = {n["text"] for n in (visit.get("consultation") or {}).get("notes") or []}
+    return {
+        "acked": len(acked),
+        "persisted": len(persisted),
+        "lost": len(set(acked) - persisted),
+        "rejected": len(rejected),
+        "per_sec": len(acked) / elapsed if elapsed else 0.0,
+        "latencies": latencies,
+    }
+
+
+def _pct(samples: list, p: float) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(p) - 1]
+
+
+def main() -> int:
+    client = get_mongo_client()
+    db = client[DB_NAME]
+    visit_repo.ensure_indexes(db)
+    strategies = (("naive", _naive), ("cas", _cas), ("atomic", _atomic))
+    print(f"{THREADS} threads x {NOTES_PER_THREAD} notes on one visit")
+    print(
+        f"{'strategy':>8} {'acked':>6} {'persisted':>9} {'lost':>5} {'rejected':>8} "
+        f"{'conflicts':>9} {'notes/s':>8} {'p50 ms':>7} {'p99 ms':>7}"
+    )
+    failed = False
+    try:
+        for name, write in strategies:
+            pid, vid = f"stress-{name}", "V000001"
+            db.visits.delete_many({"patient_id": pid})
+            db.clinicAi.delete_many({"patient_id": pid})
+            visit_repo.start_consultation(db, pid, vid)
+            conflicts_before = metrics.get_counter("visit_mutate.conflicts")
+            r = _run(write, db, pid, vid)
+            conflicts = int(metrics.get_counter("visit_mutate.conflicts") - conflicts_before)
+            print(
+                f"{name:>8} {r['acked']:>6} {r['persisted']:>9} {r['lost']:>5} {r['rejected']:>8} "
+                f"{conflicts:>9} {r['per_sec']:>8.0f} {_pct(r['latencies'], 50):>7.2f} {_pct(r['latencies'], 99):>7.2f}"
+            )
+            if name != "naive" and r["lost"]:
+                failed = True
+    finally:
+        client.drop_database(DB_NAME)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())